@@ -4,16 +4,118 @@ Especialista en análisis financiero exhaustivo y evaluación de riesgos.
 """
 
 import asyncio
-import json
-from typing import Dict, List, Optional
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
+import aiofiles
 
 from services.openai_service import OpenAIService
 from utils.report_generator import ReportGenerator
+from utils.llm_cache import FileCache
+from utils.ratios import calcular_ratios
+from utils.serializacion import (
+    cargar_json, cargar_json_archivo, volcar_json, volcar_json_comprimido,
+    JSONDecodeError, SUFIJO_COMPRIMIDO, ZSTD_DISPONIBLE
+)
+from utils.tokens import recortar_a_tokens
+from utils.indice_evaluaciones import registrar_evaluacion
+from utils.esquemas import Calificacion, Recomendaciones, ValidationError, validar
 from config.settings import settings
 from loguru import logger
 
+# Categorías de análisis en el orden en que se reportan
+CATEGORIAS_ANALISIS = ("liquidez", "solvencia", "rentabilidad", "eficiencia", "sectorial")
+
+# Claves del resultado de respaldo por categoría:
+# (datos, texto, nivel, lista de observaciones)
+ESTRUCTURA_FALLBACK = {
+    "liquidez": ("ratios", "interpretacion", "riesgo_liquidez", "observaciones"),
+    "solvencia": ("ratios", "evaluacion", "riesgo_insolvencia", "recomendaciones"),
+    "rentabilidad": ("indicadores", "analisis", "nivel_rentabilidad", "observaciones"),
+    "eficiencia": ("indicadores", "evaluacion", "nivel_eficiencia", "recomendaciones"),
+    "sectorial": ("riesgos_identificados", "evaluacion", "nivel_riesgo", "mitigaciones")
+}
+
+# Perfil humano que debe aprobar según la calificación de riesgo global
+PERFILES_APROBADOR = {
+    "BASICO": {
+        "perfil": "Analista Junior",
+        "experiencia_minima": "1-2 años",
+        "especialidad": "Análisis básico de estados financieros",
+        "autoridad": "Hasta $100,000 USD",
+        "supervision": "Revisión por muestreo"
+    },
+    "INTERMEDIO": {
+        "perfil": "Analista Senior",
+        "experiencia_minima": "3-5 años",
+        "especialidad": "Análisis de riesgos y evaluación financiera",
+        "autoridad": "Hasta $500,000 USD",
+        "supervision": "Revisión por analista principal"
+    },
+    "AVANZADO": {
+        "perfil": "Especialista en Riesgos / Gerente",
+        "experiencia_minima": "5+ años",
+        "especialidad": "Análisis complejo de riesgos y decisiones estratégicas",
+        "autoridad": "Sin límite o comité de riesgos",
+        "supervision": "Revisión por comité ejecutivo"
+    }
+}
+
+# Categorías cuyo nivel es un nivel de riesgo. En rentabilidad y eficiencia el
+# nivel mide desempeño ("BAJO" = poca rentabilidad), que equivale al riesgo
+# opuesto
+CATEGORIAS_RIESGO = ("liquidez", "solvencia", "sectorial")
+RIESGO_POR_DESEMPEÑO = {"ALTO": "BAJO", "MEDIO": "MEDIO", "BAJO": "ALTO"}
+
+# Calificación global directa cuando todas las categorías de riesgo coinciden
+# en su nivel: nivel -> (calificación, puntuación)
+CALIFICACION_UNANIME = {
+    "BAJO": ("BASICO", 20),
+    "ALTO": ("AVANZADO", 85)
+}
+
+# Patrones de las cifras del estado financiero (etiqueta al inicio de la línea
+# seguida del valor en la misma línea). Los años sueltos (p. ej. en una
+# cabecera "Activos corrientes 2023 2022") se saltan y nunca se toman como valor
+_ANIO = r"\b(?:19|20)\d{2}\b(?![.,]\d)"
+_VALOR = r"(?:[^\d\n(]|" + _ANIO + r"){0,40}?(\(?-?(?!" + _ANIO + r")\d[\d.,]*\)?)"
+PATRONES_HECHOS = {
+    nombre: re.compile(r"^\s*" + etiqueta + _VALOR, re.IGNORECASE | re.MULTILINE)
+    for nombre, etiqueta in {
+        "activo_corriente": r"(?:total\s+)?activos?\s+corrientes?",
+        # "activos\b|activo\b" evita que el plural retroceda a "activo" y la
+        # exclusión de corrientes se salte con "s corrientes"
+        "activo_total": r"(?:total\s+(?:activos\b|activo\b)(?!\s+(?:no\s+)?corrientes?)|activos?\s+totale?s?)",
+        "efectivo": r"(?:efectivo|caja\s+y\s+bancos)",
+        "cuentas_por_cobrar": r"cuentas\s+por\s+cobrar",
+        "inventarios": r"inventarios?",
+        "pasivo_corriente": r"(?:total\s+)?pasivos?\s+corrientes?",
+        "pasivo_total": r"(?:total\s+(?:pasivos\b|pasivo\b)(?!\s+(?:no\s+)?corrientes?|\s+y\s+patrimonio)|pasivos?\s+totale?s?)",
+        "cuentas_por_pagar": r"cuentas\s+por\s+pagar",
+        "patrimonio": r"(?:total\s+)?patrimonio(?:\s+neto)?",
+        "ventas": r"(?:ingresos(?!\s+(?:financieros|no\s+operacionales|por\s+intereses))(?:\s+(?:operacionales|por\s+ventas|totales))?|ventas(?:\s+netas)?)",
+        "costo_ventas": r"costos?\s+de\s+(?:las\s+)?ventas",
+        "utilidad_bruta": r"(?:utilidad|ganancia)\s+bruta",
+        "utilidad_operacional": r"(?:utilidad|ganancia)\s+(?:operacional|operativa)",
+        "gastos_financieros": r"gastos\s+financieros",
+        "utilidad_neta": r"(?:utilidad|ganancia)\s+neta"
+    }.items()
+}
+
+# Mínimo de cifras reconocidas para sustituir el texto del estado financiero
+# por las cifras estructuradas en los prompts
+MIN_HECHOS_NUMERICOS = 3
+
+# Recomendaciones usadas cuando el modelo no devuelve una lista válida
+RECOMENDACIONES_POR_DEFECTO = (
+    "Revisar estados financieros detalladamente",
+    "Monitorear indicadores clave de liquidez",
+    "Evaluar estructura de capital",
+    "Verificar flujos de efectivo",
+    "Analizar rentabilidad operativa"
+)
+
 class AnalistaRiesgos:
     """
     Agente 2: Analista de Riesgos Senior
@@ -25,10 +127,250 @@ class AnalistaRiesgos:
     - Recomendaciones de perfiles de aprobación
     """
     
+    # Plantillas de prompts, construidas una sola vez al definir la clase
+    PROMPT_ANALISIS_AGRUPADO = """
+        Como analista senior de riesgos, analiza el estado financiero de la empresa
+        {nombre} del sector {sector}.
+        
+        Estado financiero:
+        {contexto}
+        
+        Evalúa cada una de las siguientes secciones:
+        1. LIQUIDEZ: ratio corriente, prueba ácida, capital de trabajo y disponibilidad inmediata.
+        2. SOLVENCIA: ratio de endeudamiento, ratio deuda/patrimonio, cobertura de intereses,
+           apalancamiento financiero y capacidad de pago a largo plazo.
+        3. RENTABILIDAD: ROE, ROA, margen neto, margen operacional, margen bruto y
+           rentabilidad frente a la competencia del sector.
+        4. EFICIENCIA: rotación de activos, rotación de inventarios, periodos promedio de
+           cobro y pago, ciclo de conversión de efectivo y uso de recursos.
+        5. SECTORIAL: riesgos regulatorios, ciclos económicos, competencia, barreras de
+           entrada y salida, dependencia de factores externos, disrupciones tecnológicas
+           y sostenibilidad, y su impacto específico en esta empresa.
+        
+        Para cada sección interpreta los ratios precalculados (completa solo los que
+        falten), clasifica el nivel de riesgo (BAJO, MEDIO, ALTO) y justifica con
+        observaciones específicas.
+        
+        A partir de las cinco secciones determina además la calificación de riesgo
+        global con su puntuación (1-100), factores determinantes y justificación:
+        - BASICO: Riesgo bajo, empresa sólida, aprobación puede ser automática o con revisión mínima
+        - INTERMEDIO: Riesgo moderado, requiere análisis humano adicional
+        - AVANZADO: Riesgo alto, requiere análisis exhaustivo por especialista senior
+        
+        Responde en formato JSON con esta estructura:
+        {{
+            "liquidez": {{
+                "ratios": {{}},
+                "interpretacion": "",
+                "riesgo_liquidez": "BAJO|MEDIO|ALTO",
+                "observaciones": []
+            }},
+            "solvencia": {{
+                "ratios": {{}},
+                "evaluacion": "",
+                "riesgo_insolvencia": "BAJO|MEDIO|ALTO",
+                "recomendaciones": []
+            }},
+            "rentabilidad": {{
+                "indicadores": {{}},
+                "analisis": "",
+                "nivel_rentabilidad": "BAJO|MEDIO|ALTO",
+                "observaciones": []
+            }},
+            "eficiencia": {{
+                "indicadores": {{}},
+                "evaluacion": "",
+                "nivel_eficiencia": "BAJO|MEDIO|ALTO",
+                "recomendaciones": []
+            }},
+            "sectorial": {{
+                "riesgos_identificados": [],
+                "evaluacion": "",
+                "nivel_riesgo": "BAJO|MEDIO|ALTO",
+                "mitigaciones": []
+            }},
+            "calificacion": {{
+                "nivel": "BASICO|INTERMEDIO|AVANZADO",
+                "puntuacion": 0,
+                "factores": [],
+                "justificacion": ""
+            }}
+        }}
+        """
+    
+    PROMPT_LIQUIDEZ = """
+        Como analista senior de riesgos, analiza la liquidez de la empresa {nombre} 
+        del sector {sector}.
+        
+        Basándote en el siguiente estado financiero:
+        {contexto}
+        
+        Evalúa:
+        1. Ratio corriente (activo corriente / pasivo corriente)
+        2. Prueba ácida ((activo corriente - inventarios) / pasivo corriente)
+        3. Capital de trabajo (activo corriente - pasivo corriente)
+        4. Disponibilidad inmediata
+        
+        Proporciona:
+        - Valores de los ratios (usa los precalculados cuando estén disponibles)
+        - Interpretación de cada ratio
+        - Riesgo de liquidez (BAJO, MEDIO, ALTO)
+        - Observaciones específicas
+        
+        Responde en formato JSON con esta estructura:
+        {{
+            "ratios": {{}},
+            "interpretacion": "",
+            "riesgo_liquidez": "BAJO|MEDIO|ALTO",
+            "observaciones": []
+        }}
+        """
+    
+    PROMPT_SOLVENCIA = """
+        Como analista senior, evalúa la solvencia de {nombre} 
+        del sector {sector}.
+        
+        Estado financiero:
+        {contexto}
+        
+        Analiza:
+        1. Ratio de endeudamiento (pasivo total / activo total)
+        2. Ratio deuda/patrimonio
+        3. Cobertura de intereses
+        4. Apalancamiento financiero
+        5. Capacidad de pago a largo plazo
+        
+        Evalúa el riesgo de insolvencia y proporciona análisis detallado.
+        
+        Responde en formato JSON con esta estructura:
+        {{
+            "ratios": {{}},
+            "evaluacion": "",
+            "riesgo_insolvencia": "BAJO|MEDIO|ALTO",
+            "recomendaciones": []
+        }}
+        """
+    
+    PROMPT_RENTABILIDAD = """
+        Evalúa la rentabilidad de {nombre} como analista experto.
+        
+        Sector: {sector}
+        Estado financiero:
+        {contexto}
+        
+        Interpreta (a partir de los ratios precalculados cuando estén disponibles):
+        1. ROE (Return on Equity)
+        2. ROA (Return on Assets)
+        3. Margen neto
+        4. Margen operacional
+        5. Margen bruto
+        6. Rentabilidad vs competencia del sector
+        
+        Evalúa tendencias y sostenibilidad de la rentabilidad.
+        Responde en formato JSON con análisis detallado.
+        """
+    
+    PROMPT_EFICIENCIA = """
+        Analiza la eficiencia operativa de {nombre}.
+        
+        Información:
+        - Sector: {sector}
+        - Estado financiero: {contexto}
+        
+        Evalúa:
+        1. Rotación de activos
+        2. Rotación de inventarios
+        3. Periodo promedio de cobro
+        4. Periodo promedio de pago
+        5. Ciclo de conversión de efectivo
+        6. Eficiencia en el uso de recursos
+        
+        Compara con estándares del sector y proporciona recomendaciones.
+        Responde en formato JSON.
+        """
+    
+    PROMPT_SECTORIAL = """
+        Como analista senior especializado, evalúa los riesgos específicos del sector 
+        {sector} para la empresa {nombre}.
+        
+        Considera:
+        1. Riesgos regulatorios del sector
+        2. Ciclos económicos que afectan al sector
+        3. Competencia y concentración del mercado
+        4. Barreras de entrada y salida
+        5. Dependencia de factores externos
+        6. Innovación tecnológica y disrupciones
+        7. Sostenibilidad y responsabilidad social
+        
+        Evalúa cómo estos riesgos impactan específicamente a esta empresa.
+        Responde en formato JSON con análisis detallado.
+        """
+    
+    PROMPT_CALIFICACION = """
+        Como analista senior de riesgos, basándote en el siguiente resumen de los
+        análisis por categoría (nivel de riesgo, o de desempeño en rentabilidad
+        y eficiencia, e indicadores clave):
+        
+        {resumen}
+        
+        Determina una calificación de riesgo global:
+        - BASICO: Riesgo bajo, empresa sólida, aprobación puede ser automática o con revisión mínima
+        - INTERMEDIO: Riesgo moderado, requiere análisis humano adicional
+        - AVANZADO: Riesgo alto, requiere análisis exhaustivo por especialista senior
+        
+        Proporciona:
+        1. Nivel de riesgo (BASICO/INTERMEDIO/AVANZADO)
+        2. Puntuación numérica (1-100)
+        3. Factores determinantes
+        4. Justificación detallada
+        
+        Responde en formato JSON con esta estructura:
+        {{
+            "nivel": "BASICO|INTERMEDIO|AVANZADO",
+            "puntuacion": 0,
+            "factores": [],
+            "justificacion": ""
+        }}
+        """
+    
+    PROMPT_RECOMENDACIONES = """
+        Basándote en la calificación de riesgo {calificacion} y el análisis detallado,
+        genera recomendaciones específicas y accionables para:
+        
+        1. Mitigación de riesgos identificados
+        2. Mejoras en la gestión financiera
+        3. Aspectos a monitorear
+        4. Acciones correctivas sugeridas
+        5. Oportunidades de mejora
+        
+        Proporciona entre 5-10 recomendaciones concretas.
+        Responde en formato JSON con esta estructura:
+        {{"recomendaciones": ["", ""]}}
+        """
+    
+    PROMPT_RESUMEN_EJECUTIVO = """
+        Genera un resumen ejecutivo profesional basado en:
+        
+        CALIFICACIÓN: {calificacion}
+        ANÁLISIS DETALLADO: {analisis}
+        
+        El resumen debe:
+        1. Ser conciso (máximo 300 palabras)
+        2. Destacar los puntos clave
+        3. Incluir la recomendación final
+        4. Ser comprensible para ejecutivos
+        5. Mencionar los principales riesgos y fortalezas
+        
+        Escribe en tono profesional y directo.
+        """
+    
     def __init__(self):
         """Inicializa el Analista de Riesgos."""
         self.openai_service = OpenAIService(api_key=settings.OPENAI_SEGUNDO_AGENTE)
         self.report_generator = ReportGenerator()
+        self.cache = FileCache() if settings.LLM_CACHE_ENABLED else None
+        self._input_dir = Path(settings.INPUT_DIR)
+        self._output_dir = Path(settings.OUTPUT_DIR)
         
         # Criterios de análisis
         self.criterios_analisis = {
@@ -59,37 +401,73 @@ class AnalistaRiesgos:
             
             logger.info(f"📊 Iniciando análisis financiero para: {datos_analisis['empresa']['nombre']}")
             
-            # Realizar análisis por categorías
-            analisis_resultados = {}
+            # Marca de tiempo única para todo el análisis
+            fecha_analisis = datetime.now().isoformat()
+            datos_analisis["fecha_analisis"] = fecha_analisis
+            
+            # Cifras y ratios determinísticos, calculados una sola vez por análisis
+            datos_analisis["hechos"] = self._extraer_hechos_numericos(datos_analisis["contenido_extraido"])
+            datos_analisis["ratios"] = calcular_ratios(datos_analisis["hechos"])
             
-            # 1. Análisis de liquidez
-            analisis_resultados["liquidez"] = await self._analizar_liquidez(datos_analisis)
+            # Analizar las cinco categorías y la calificación global con una
+            # sola petición a OpenAI
+            analisis_resultados, calificacion_agrupada = await self._analizar_todo(datos_analisis)
             
-            # 2. Análisis de solvencia
-            analisis_resultados["solvencia"] = await self._analizar_solvencia(datos_analisis)
+            # Las categorías que falten en la respuesta agrupada se analizan
+            # por separado y en paralelo
+            metodos_categoria = {
+                "liquidez": self._analizar_liquidez,
+                "solvencia": self._analizar_solvencia,
+                "rentabilidad": self._analizar_rentabilidad,
+                "eficiencia": self._analizar_eficiencia,
+                "sectorial": self._analizar_riesgo_sectorial
+            }
+            pendientes = [c for c in CATEGORIAS_ANALISIS if c not in analisis_resultados]
             
-            # 3. Análisis de rentabilidad
-            analisis_resultados["rentabilidad"] = await self._analizar_rentabilidad(datos_analisis)
+            if pendientes:
+                logger.warning(f"⚠️ Analizando por separado: {', '.join(pendientes)}")
+                resultados = await asyncio.gather(
+                    *(metodos_categoria[categoria](datos_analisis) for categoria in pendientes),
+                    return_exceptions=True
+                )
+                
+                for categoria, resultado in zip(pendientes, resultados):
+                    if isinstance(resultado, Exception):
+                        logger.error(f"Error en análisis de {categoria}: {str(resultado)}")
+                        resultado = self._resultado_fallback(
+                            categoria,
+                            f"Error inesperado: {str(resultado)}",
+                            "Error en procesamiento",
+                            fecha_analisis
+                        )
+                    analisis_resultados[categoria] = resultado
             
-            # 4. Análisis de eficiencia
-            analisis_resultados["eficiencia"] = await self._analizar_eficiencia(datos_analisis)
+            analisis_resultados = {c: analisis_resultados[c] for c in CATEGORIAS_ANALISIS}
             
-            # 5. Análisis sectorial
-            analisis_resultados["sectorial"] = await self._analizar_riesgo_sectorial(datos_analisis)
+            # Generar calificación global (la agrupada solo es válida si se
+            # basó en las cinco categorías finales)
+            calificacion_riesgo = await self._generar_calificacion_riesgo(
+                analisis_resultados,
+                None if pendientes else calificacion_agrupada
+            )
             
-            # Generar calificación global
-            calificacion_riesgo = await self._generar_calificacion_riesgo(analisis_resultados)
+            # Recomendaciones y resumen ejecutivo son independientes entre sí
+            recomendaciones, resumen_ejecutivo = await asyncio.gather(
+                self._generar_recomendaciones(calificacion_riesgo, analisis_resultados),
+                self._generar_resumen_ejecutivo(analisis_resultados, calificacion_riesgo)
+            )
             
             # Preparar reporte final
             reporte_final = {
                 "session_id": session_id,
                 "empresa": datos_analisis["empresa"],
-                "fecha_analisis": datetime.now().isoformat(),
+                "fecha_analisis": fecha_analisis,
                 "analisis_detallado": analisis_resultados,
+                "ratios_calculados": datos_analisis["ratios"],
                 "calificacion_riesgo": calificacion_riesgo,
-                "recomendaciones": await self._generar_recomendaciones(calificacion_riesgo, analisis_resultados),
+                "recomendaciones": recomendaciones,
                 "perfil_aprobador": self._determinar_perfil_aprobador(calificacion_riesgo),
-                "resumen_ejecutivo": await self._generar_resumen_ejecutivo(analisis_resultados, calificacion_riesgo)
+                "resumen_ejecutivo": resumen_ejecutivo
             }
             
             # Guardar análisis completo
@@ -109,669 +487,595 @@ class AnalistaRiesgos:
     
     async def _cargar_datos_analisis(self, session_id: str) -> Dict:
         """Carga los datos preparados por la Secretaria Virtual."""
-        archivo_datos = Path(settings.INPUT_DIR) / f"{session_id}_datos_analisis.json"
-        
-        if not archivo_datos.exists():
-            return {"error": "Datos de análisis no encontrados"}
+        archivo_datos = self._input_dir / f"{session_id}_datos_analisis.json"
         
         try:
-            with open(archivo_datos, 'r', encoding='utf-8') as f:
-                datos = json.load(f)
+            async with aiofiles.open(archivo_datos, 'rb') as f:
+                datos = cargar_json(await f.read())
             return datos
+        except FileNotFoundError:
+            return {"error": "Datos de análisis no encontrados"}
         except Exception as e:
             return {"error": f"Error cargando datos: {str(e)}"}
     
-    async def _analizar_liquidez(self, datos: Dict) -> Dict:
-        """Analiza los indicadores de liquidez."""
-        prompt = f"""
-        Como analista senior de riesgos, analiza la liquidez de la empresa {datos['empresa']['nombre']} 
-        del sector {datos['empresa']['sector']}.
-        
-        Basándote en el siguiente estado financiero:
-        {datos['contenido_extraido'][:1500]}
+    @staticmethod
+    def _convertir_numero(valor: str) -> Optional[float]:
+        """Convierte una cifra como '1,500,000', '1.500.000,50' o '(300)' a float."""
+        negativo = valor.startswith("(") or valor.startswith("-")
+        # Un separador al final es puntuación de la frase, no parte de la cifra
+        valor = valor.strip("()-").rstrip(".,")
         
-        Evalúa:
-        1. Ratio corriente (activo corriente / pasivo corriente)
-        2. Prueba ácida ((activo corriente - inventarios) / pasivo corriente)
-        3. Capital de trabajo (activo corriente - pasivo corriente)
-        4. Disponibilidad inmediata
+        if "," in valor and "." in valor:
+            # El último separador es el decimal
+            if valor.rfind(",") > valor.rfind("."):
+                valor = valor.replace(".", "").replace(",", ".")
+            else:
+                valor = valor.replace(",", "")
+        else:
+            for separador in (",", "."):
+                partes = valor.split(separador)
+                # "0,123" es un decimal: ninguna cifra de miles empieza por 0
+                if len(partes) > 2 or (len(partes) == 2 and len(partes[1]) == 3 and partes[0] != "0"):
+                    valor = valor.replace(separador, "")
+                elif len(partes) == 2:
+                    valor = valor.replace(separador, ".")
         
-        Proporciona:
-        - Valores calculados
-        - Interpretación de cada ratio
-        - Riesgo de liquidez (BAJO, MEDIO, ALTO)
-        - Observaciones específicas
+        try:
+            numero = float(valor)
+        except ValueError:
+            return None
         
-        Responde en formato JSON con esta estructura:
-        {{
-            "ratios": {{}},
-            "interpretacion": "",
-            "riesgo_liquidez": "BAJO|MEDIO|ALTO",
-            "observaciones": []
-        }}
+        return -numero if negativo else numero
+    
+    def _extraer_hechos_numericos(self, contenido_extraido: str) -> Dict:
         """
+        Extrae las cifras principales del estado financiero (activos, pasivos,
+        patrimonio, ventas, utilidades...) mediante expresiones regulares.
         
-        try:
-            logger.info("🔄 Solicitando análisis de liquidez a OpenAI...")
-            response = await self.openai_service.generar_respuesta_json(prompt)
-            
-            logger.debug(f"📥 Respuesta de OpenAI recibida: {response[:200]}...")
-            
-            # Verificar que la respuesta no esté vacía
-            if not response or response.strip() == "":
-                logger.error("❌ Respuesta vacía de OpenAI")
-                return {
-                    "categoria": "liquidez",
-                    "resultado": {
-                        "ratios": {},
-                        "interpretacion": "No se pudo realizar el análisis por falta de respuesta del modelo",
-                        "riesgo_liquidez": "MEDIO",
-                        "observaciones": ["Error en análisis automático"]
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            analisis = json.loads(response)
-            
-            # Verificar si hay error en la respuesta
-            if "error" in analisis:
-                logger.error(f"Error en respuesta de análisis de liquidez: {analisis['error']}")
-                return {
-                    "categoria": "liquidez",
-                    "resultado": {
-                        "ratios": {},
-                        "interpretacion": f"Error en análisis: {analisis.get('error', 'Desconocido')}",
-                        "riesgo_liquidez": "MEDIO",
-                        "observaciones": ["Error en procesamiento"]
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
+        Args:
+            contenido_extraido: Texto extraído del PDF
             
-            logger.success("✅ Análisis de liquidez completado")
-            return {
-                "categoria": "liquidez",
-                "resultado": analisis,
-                "timestamp": datetime.now().isoformat()
-            }
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decodificando JSON en análisis de liquidez: {str(e)}")
-            logger.debug(f"Respuesta que causó error: {response if 'response' in locals() else 'N/A'}")
-            return {
-                "categoria": "liquidez",
-                "resultado": {
-                    "ratios": {},
-                    "interpretacion": "Error en formato de respuesta del modelo de IA",
-                    "riesgo_liquidez": "MEDIO",
-                    "observaciones": ["Respuesta inválida del modelo"]
-                },
-                "timestamp": datetime.now().isoformat()
-            }
-        except Exception as e:
-            logger.error(f"Error en análisis de liquidez: {str(e)}")
-            return {
-                "categoria": "liquidez",
-                "resultado": {
-                    "ratios": {},
-                    "interpretacion": f"Error inesperado: {str(e)}",
-                    "riesgo_liquidez": "MEDIO",
-                    "observaciones": ["Error en procesamiento"]
-                },
-                "timestamp": datetime.now().isoformat()
-            }
+        Returns:
+            Dict nombre de la cifra -> valor numérico (solo las encontradas)
+        """
+        hechos = {}
+        
+        for nombre, patron in PATRONES_HECHOS.items():
+            coincidencia = patron.search(contenido_extraido)
+            if coincidencia:
+                valor = self._convertir_numero(coincidencia.group(1))
+                if valor is not None:
+                    hechos[nombre] = valor
+        
+        logger.debug(f"🔢 Cifras extraídas del estado financiero: {len(hechos)}")
+        return hechos
     
-    async def _analizar_solvencia(self, datos: Dict) -> Dict:
-        """Analiza los indicadores de solvencia."""
-        prompt = f"""
-        Como analista senior, evalúa la solvencia de {datos['empresa']['nombre']} 
-        del sector {datos['empresa']['sector']}.
+    def _contexto_financiero(self, datos: Dict) -> str:
+        """
+        Devuelve el contexto del estado financiero para los prompts.
         
-        Estado financiero:
-        {datos['contenido_extraido'][:1500]}
+        El contexto se construye una sola vez por análisis y se guarda en
+        `datos`. Si se reconocen suficientes cifras se envían como JSON
+        compacto; si no, se recurre al texto extraído del PDF recortado a
+        settings.CONTEXT_TOKEN_BUDGET tokens.
+        """
+        if "contexto_financiero" in datos:
+            return datos["contexto_financiero"]
         
-        Analiza:
-        1. Ratio de endeudamiento (pasivo total / activo total)
-        2. Ratio deuda/patrimonio
-        3. Cobertura de intereses
-        4. Apalancamiento financiero
-        5. Capacidad de pago a largo plazo
+        if "hechos" not in datos:
+            datos["hechos"] = self._extraer_hechos_numericos(datos["contenido_extraido"])
+            datos["ratios"] = calcular_ratios(datos["hechos"])
         
-        Evalúa el riesgo de insolvencia y proporciona análisis detallado.
+        if len(datos["hechos"]) < MIN_HECHOS_NUMERICOS:
+            datos["contexto_financiero"] = recortar_a_tokens(
+                datos["contenido_extraido"],
+                settings.CONTEXT_TOKEN_BUDGET,
+                self.openai_service.model
+            )
+            return datos["contexto_financiero"]
         
-        Responde en formato JSON con esta estructura:
-        {{
-            "ratios": {{}},
-            "evaluacion": "",
-            "riesgo_insolvencia": "BAJO|MEDIO|ALTO",
-            "recomendaciones": []
-        }}
+        datos["contexto_financiero"] = (
+            f"Cifras del estado financiero: {volcar_json(datos['hechos']).decode('utf-8')}\n"
+            f"        Ratios precalculados (exactos, no los recalcules; clasifica el riesgo "
+            f"y justifica a partir de ellos): "
+            f"{volcar_json(datos['ratios']).decode('utf-8')}"
+        )
+        return datos["contexto_financiero"]
+    
+    def _variables_prompt(self, datos: Dict) -> Dict[str, str]:
         """
+        Devuelve las variables comunes de los prompts de análisis (nombre,
+        sector y contexto financiero), construidas una sola vez por análisis.
+        """
+        if "variables_prompt" not in datos:
+            datos["variables_prompt"] = {
+                "nombre": datos['empresa']['nombre'],
+                "sector": datos['empresa']['sector'],
+                "contexto": self._contexto_financiero(datos)
+            }
         
-        try:
-            logger.info("🔄 Solicitando análisis de solvencia a OpenAI...")
-            response = await self.openai_service.generar_respuesta_json(prompt)
-            
-            logger.debug(f"📥 Respuesta de OpenAI recibida: {response[:200]}...")
-            
-            # Verificar que la respuesta no esté vacía
-            if not response or response.strip() == "":
-                logger.error("❌ Respuesta vacía de OpenAI")
-                return {
-                    "categoria": "solvencia",
-                    "resultado": {
-                        "ratios": {},
-                        "evaluacion": "No se pudo realizar el análisis por falta de respuesta del modelo",
-                        "riesgo_insolvencia": "MEDIO",
-                        "recomendaciones": ["Error en análisis automático"]
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            analisis = json.loads(response)
+        return datos["variables_prompt"]
+    
+    def _fallback_categoria(self, categoria: str, mensaje: str, observacion: str) -> Dict:
+        """Construye el resultado de respaldo (riesgo MEDIO) de una categoría."""
+        clave_datos, clave_texto, clave_nivel, clave_lista = ESTRUCTURA_FALLBACK[categoria]
+        
+        return {
+            clave_datos: [] if categoria == "sectorial" else {},
+            clave_texto: mensaje,
+            clave_nivel: "MEDIO",
+            clave_lista: [observacion]
+        }
+    
+    def _entrada_categoria(self, categoria: str, resultado: Any, timestamp: str) -> Dict:
+        """Envuelve el resultado de una categoría con su resumen y metadata."""
+        return {
+            "categoria": categoria,
+            "resultado": resultado,
+            "resumen": self._resumir_categoria(categoria, resultado),
+            "timestamp": timestamp
+        }
+    
+    def _resultado_fallback(self, categoria: str, mensaje: str, observacion: str, timestamp: str) -> Dict:
+        """Construye la entrada de análisis de respaldo de una categoría."""
+        return self._entrada_categoria(
+            categoria,
+            self._fallback_categoria(categoria, mensaje, observacion),
+            timestamp
+        )
+    
+    @staticmethod
+    def _marca_tiempo(datos: Dict) -> str:
+        """Marca de tiempo del análisis en curso (o la actual si no hay una)."""
+        return datos.get("fecha_analisis") or datetime.now().isoformat()
+    
+    async def _generar_con_cache(
+        self,
+        clave: str,
+        solicitar: Callable[[], Awaitable[str]],
+        es_cacheable: Callable[[str], bool]
+    ) -> str:
+        """
+        Devuelve la respuesta almacenada en la caché para la clave o la solicita
+        a OpenAI y la guarda.
+        
+        Args:
+            clave: Clave de la petición en la caché
+            solicitar: Función que realiza la petición a OpenAI
+            es_cacheable: Indica si una respuesta puede guardarse
             
-            # Verificar si hay error en la respuesta
-            if "error" in analisis:
-                logger.error(f"Error en respuesta de análisis de solvencia: {analisis['error']}")
-                return {
-                    "categoria": "solvencia",
-                    "resultado": {
-                        "ratios": {},
-                        "evaluacion": f"Error en análisis: {analisis.get('error', 'Desconocido')}",
-                        "riesgo_insolvencia": "MEDIO",
-                        "recomendaciones": ["Error en procesamiento"]
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
+        Returns:
+            Respuesta del modelo
+        """
+        response = await self.cache.obtener(clave)
+        if response is not None:
+            logger.info("♻️ Respuesta de OpenAI recuperada de la caché")
+            return response
+        
+        response = await solicitar()
+        
+        if es_cacheable(response):
+            await self.cache.guardar(clave, response)
+        
+        return response
+    
+    @staticmethod
+    def _es_json_valido(response: str) -> bool:
+        """Indica si la respuesta es un JSON válido que no describe un error."""
+        try:
+            contenido = cargar_json(response)
+        except JSONDecodeError:
+            return False
+        
+        return not (isinstance(contenido, dict) and "error" in contenido)
+    
+    async def _generar_respuesta_json_cacheada(self, prompt: str, forzar_objeto: bool = False) -> str:
+        """
+        Solicita una respuesta JSON a OpenAI reutilizando respuestas previas
+        idénticas (mismo modelo y prompt) almacenadas en la caché.
+        
+        Args:
+            prompt: Prompt del análisis
+            forzar_objeto: Usa el modo JSON de OpenAI
             
-            logger.success("✅ Análisis de solvencia completado")
-            return {
-                "categoria": "solvencia",
-                "resultado": analisis,
-                "timestamp": datetime.now().isoformat()
-            }
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decodificando JSON en análisis de solvencia: {str(e)}")
-            logger.debug(f"Respuesta que causó error: {response if 'response' in locals() else 'N/A'}")
-            return {
-                "categoria": "solvencia",
-                "resultado": {
-                    "ratios": {},
-                    "evaluacion": "Error en formato de respuesta del modelo de IA",
-                    "riesgo_insolvencia": "MEDIO",
-                    "recomendaciones": ["Respuesta inválida del modelo"]
-                },
-                "timestamp": datetime.now().isoformat()
-            }
-        except Exception as e:
-            logger.error(f"Error en análisis de solvencia: {str(e)}")
-            return {
-                "categoria": "solvencia",
-                "resultado": {"error": str(e)},
-                "timestamp": datetime.now().isoformat()
-            }
+        Returns:
+            Respuesta en formato JSON como string
+        """
+        def solicitar() -> Awaitable[str]:
+            return self.openai_service.generar_respuesta_json(prompt, forzar_objeto=forzar_objeto)
+        
+        if not self.cache:
+            return await solicitar()
+        
+        # Solo se guardan respuestas válidas, nunca los JSON de error
+        return await self._generar_con_cache(
+            FileCache.generar_clave(self.openai_service.model, prompt),
+            solicitar,
+            self._es_json_valido
+        )
     
-    async def _analizar_rentabilidad(self, datos: Dict) -> Dict:
-        """Analiza los indicadores de rentabilidad."""
-        prompt = f"""
-        Evalúa la rentabilidad de {datos['empresa']['nombre']} como analista experto.
+    async def _generar_respuesta_texto_cacheada(self, prompt: str) -> str:
+        """
+        Solicita una respuesta de texto libre a OpenAI usando la caché.
         
-        Sector: {datos['empresa']['sector']}
-        Estado financiero:
-        {datos['contenido_extraido'][:1500]}
+        Args:
+            prompt: Prompt a enviar
+            
+        Returns:
+            Respuesta generada por el modelo
+        """
+        def solicitar() -> Awaitable[str]:
+            return self.openai_service.generar_respuesta_streaming(prompt)
         
-        Calcula y analiza:
-        1. ROE (Return on Equity)
-        2. ROA (Return on Assets)
-        3. Margen neto
-        4. Margen operacional
-        5. Margen bruto
-        6. Rentabilidad vs competencia del sector
+        if not self.cache:
+            return await solicitar()
         
-        Evalúa tendencias y sostenibilidad de la rentabilidad.
-        Responde en formato JSON con análisis detallado.
+        return await self._generar_con_cache(
+            FileCache.generar_clave(self.openai_service.model, "texto", prompt),
+            solicitar,
+            bool
+        )
+    
+    async def _solicitar_json_seguro(
+        self,
+        prompt: str,
+        descripcion: str,
+        fallback: Callable[[str, str], Any],
+        forzar_objeto: bool = False,
+        esquema: Optional[Any] = None
+    ) -> Any:
+        """
+        Solicita una respuesta JSON a OpenAI con el manejo de errores común.
+        
+        Args:
+            prompt: Prompt a enviar
+            descripcion: Descripción de la petición para los logs
+            fallback: Función (mensaje, observación) que construye el valor de
+                respaldo si la respuesta está vacía, trae error o no es JSON
+            forzar_objeto: Usa el modo JSON de OpenAI
+            esquema: Esquema de utils.esquemas que debe cumplir la respuesta (opcional)
+            
+        Returns:
+            JSON decodificado (validado si se indica esquema) o el valor de respaldo
         """
+        response = None
         
         try:
-            logger.info("🔄 Solicitando análisis de rentabilidad a OpenAI...")
-            response = await self.openai_service.generar_respuesta_json(prompt)
+            logger.info(f"🔄 Solicitando {descripcion} a OpenAI...")
+            response = await self._generar_respuesta_json_cacheada(prompt, forzar_objeto=forzar_objeto)
             
-            logger.debug(f"📥 Respuesta de OpenAI recibida: {response[:200]}...")
+            logger.opt(lazy=True).debug("📥 Respuesta de OpenAI recibida: {}...", lambda: response[:200])
             
             # Verificar que la respuesta no esté vacía
             if not response or response.strip() == "":
-                logger.error("❌ Respuesta vacía de OpenAI")
-                return {
-                    "categoria": "rentabilidad",
-                    "resultado": {
-                        "indicadores": {},
-                        "analisis": "No se pudo realizar el análisis por falta de respuesta del modelo",
-                        "nivel_rentabilidad": "MEDIO",
-                        "observaciones": ["Error en análisis automático"]
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
+                logger.error(f"❌ Respuesta vacía de OpenAI en {descripcion}")
+                return fallback(
+                    "No se pudo realizar el análisis por falta de respuesta del modelo",
+                    "Error en análisis automático"
+                )
             
-            analisis = json.loads(response)
+            contenido = cargar_json(response)
             
             # Verificar si hay error en la respuesta
-            if "error" in analisis:
-                logger.error(f"Error en respuesta de análisis de rentabilidad: {analisis['error']}")
-                return {
-                    "categoria": "rentabilidad",
-                    "resultado": {
-                        "indicadores": {},
-                        "analisis": f"Error en análisis: {analisis.get('error', 'Desconocido')}",
-                        "nivel_rentabilidad": "MEDIO",
-                        "observaciones": ["Error en procesamiento"]
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
+            if isinstance(contenido, dict) and "error" in contenido:
+                logger.error(f"Error en respuesta de {descripcion}: {contenido['error']}")
+                return fallback(
+                    f"Error en análisis: {contenido.get('error', 'Desconocido')}",
+                    "Error en procesamiento"
+                )
             
-            logger.success("✅ Análisis de rentabilidad completado")
-            return {
-                "categoria": "rentabilidad",
-                "resultado": analisis,
-                "timestamp": datetime.now().isoformat()
-            }
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decodificando JSON en análisis de rentabilidad: {str(e)}")
-            logger.debug(f"Respuesta que causó error: {response if 'response' in locals() else 'N/A'}")
-            return {
-                "categoria": "rentabilidad",
-                "resultado": {
-                    "indicadores": {},
-                    "analisis": "Error en formato de respuesta del modelo de IA",
-                    "nivel_rentabilidad": "MEDIO",
-                    "observaciones": ["Respuesta inválida del modelo"]
-                },
-                "timestamp": datetime.now().isoformat()
-            }
+            if esquema is not None:
+                contenido = validar(contenido, esquema)
+            
+            logger.success(f"✅ Respuesta procesada: {descripcion}")
+            return contenido
+        except ValidationError as e:
+            logger.error(f"Respuesta fuera de esquema en {descripcion}: {str(e)}")
+            return fallback("Formato de respuesta inesperado del modelo de IA", "Error de formato")
+        except JSONDecodeError as e:
+            logger.error(f"Error decodificando JSON en {descripcion}: {str(e)}")
+            logger.opt(lazy=True).debug(
+                "Respuesta que causó error: {}", lambda: response if response is not None else "N/A"
+            )
+            return fallback("Error en formato de respuesta del modelo de IA", "Respuesta inválida del modelo")
         except Exception as e:
-            logger.error(f"Error en análisis de rentabilidad: {str(e)}")
-            return {
-                "categoria": "rentabilidad",
-                "resultado": {
-                    "indicadores": {},
-                    "analisis": f"Error técnico: {str(e)}",
-                    "nivel_rentabilidad": "MEDIO",
-                    "observaciones": ["Error en procesamiento"]
-                },
-                "timestamp": datetime.now().isoformat()
-            }
+            logger.error(f"Error en {descripcion}: {str(e)}")
+            return fallback(f"Error inesperado: {str(e)}", "Error en procesamiento")
     
-    async def _analizar_eficiencia(self, datos: Dict) -> Dict:
-        """Analiza los indicadores de eficiencia operativa."""
-        prompt = f"""
-        Analiza la eficiencia operativa de {datos['empresa']['nombre']}.
+    async def _analizar_categoria(
+        self,
+        categoria: str,
+        prompt: str,
+        descripcion: str,
+        timestamp: str
+    ) -> Dict:
+        """Ejecuta el análisis de una categoría y lo envuelve con su metadata."""
+        resultado = await self._solicitar_json_seguro(
+            prompt,
+            descripcion,
+            lambda mensaje, observacion: self._fallback_categoria(categoria, mensaje, observacion)
+        )
         
-        Información:
-        - Sector: {datos['empresa']['sector']}
-        - Estado financiero: {datos['contenido_extraido'][:1500]}
+        return self._entrada_categoria(categoria, resultado, timestamp)
+    
+    async def _analizar_todo(self, datos: Dict) -> Tuple[Dict, Optional[Dict]]:
+        """
+        Analiza las cinco categorías y la calificación global con una sola
+        petición a OpenAI.
         
-        Evalúa:
-        1. Rotación de activos
-        2. Rotación de inventarios
-        3. Periodo promedio de cobro
-        4. Periodo promedio de pago
-        5. Ciclo de conversión de efectivo
-        6. Eficiencia en el uso de recursos
+        El estado financiero se envía una única vez y la respuesta se reparte
+        en los mismos resultados por categoría que generan los métodos
+        `_analizar_*`.
         
-        Compara con estándares del sector y proporciona recomendaciones.
-        Responde en formato JSON.
+        Args:
+            datos: Datos preparados por la Secretaria Virtual
+            
+        Returns:
+            Tupla (dict categoría -> resultado, calificación global). Omite las
+            categorías que el modelo no devolvió correctamente; la calificación
+            es None si falta o no tiene un nivel válido.
         """
+        prompt = self.PROMPT_ANALISIS_AGRUPADO.format_map(self._variables_prompt(datos))
         
-        try:
-            logger.info("🔄 Solicitando análisis de eficiencia a OpenAI...")
-            response = await self.openai_service.generar_respuesta_json(prompt)
-            
-            logger.debug(f"📥 Respuesta de OpenAI recibida: {response[:200]}...")
-            
-            # Verificar que la respuesta no esté vacía
-            if not response or response.strip() == "":
-                logger.error("❌ Respuesta vacía de OpenAI")
-                return {
-                    "categoria": "eficiencia",
-                    "resultado": {
-                        "indicadores": {},
-                        "evaluacion": "No se pudo realizar el análisis por falta de respuesta del modelo",
-                        "nivel_eficiencia": "MEDIO",
-                        "recomendaciones": ["Error en análisis automático"]
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            analisis = json.loads(response)
-            
-            # Verificar si hay error en la respuesta
-            if "error" in analisis:
-                logger.error(f"Error en respuesta de análisis de eficiencia: {analisis['error']}")
-                return {
-                    "categoria": "eficiencia",
-                    "resultado": {
-                        "indicadores": {},
-                        "evaluacion": f"Error en análisis: {analisis.get('error', 'Desconocido')}",
-                        "nivel_eficiencia": "MEDIO",
-                        "recomendaciones": ["Error en procesamiento"]
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            logger.success("✅ Análisis de eficiencia completado")
-            return {
-                "categoria": "eficiencia",
-                "resultado": analisis,
-                "timestamp": datetime.now().isoformat()
-            }
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decodificando JSON en análisis de eficiencia: {str(e)}")
-            logger.debug(f"Respuesta que causó error: {response if 'response' in locals() else 'N/A'}")
-            return {
-                "categoria": "eficiencia",
-                "resultado": {
-                    "indicadores": {},
-                    "evaluacion": "Error en formato de respuesta del modelo de IA",
-                    "nivel_eficiencia": "MEDIO",
-                    "recomendaciones": ["Respuesta inválida del modelo"]
-                },
-                "timestamp": datetime.now().isoformat()
-            }
-        except Exception as e:
-            logger.error(f"Error en análisis de eficiencia: {str(e)}")
-            return {
-                "categoria": "eficiencia",
-                "resultado": {
-                    "indicadores": {},
-                    "evaluacion": f"Error técnico: {str(e)}",
-                    "nivel_eficiencia": "MEDIO",
-                    "recomendaciones": ["Error en procesamiento"]
-                },
-                "timestamp": datetime.now().isoformat()
-            }
+        analisis = await self._solicitar_json_seguro(
+            prompt,
+            "análisis financiero agrupado",
+            lambda mensaje, observacion: {},
+            forzar_objeto=True
+        )
+        
+        timestamp = self._marca_tiempo(datos)
+        resultados = {}
+        
+        for categoria in CATEGORIAS_ANALISIS:
+            seccion = analisis.get(categoria) if isinstance(analisis, dict) else None
+            if isinstance(seccion, dict) and seccion:
+                resultados[categoria] = self._entrada_categoria(categoria, seccion, timestamp)
+        
+        calificacion = None
+        if isinstance(analisis, dict) and "calificacion" in analisis:
+            try:
+                calificacion = validar(analisis["calificacion"], Calificacion)
+            except ValidationError as e:
+                logger.warning(f"⚠️ Calificación agrupada descartada: {str(e)}")
+        
+        logger.info(f"📊 Análisis agrupado: {len(resultados)}/{len(CATEGORIAS_ANALISIS)} categorías recibidas")
+        return resultados, calificacion
     
-    async def _analizar_riesgo_sectorial(self, datos: Dict) -> Dict:
-        """Analiza riesgos específicos del sector."""
-        prompt = f"""
-        Como analista senior especializado, evalúa los riesgos específicos del sector 
-        {datos['empresa']['sector']} para la empresa {datos['empresa']['nombre']}.
+    async def _analizar_liquidez(self, datos: Dict) -> Dict:
+        """
+        Analiza los indicadores de liquidez.
         
-        Considera:
-        1. Riesgos regulatorios del sector
-        2. Ciclos económicos que afectan al sector
-        3. Competencia y concentración del mercado
-        4. Barreras de entrada y salida
-        5. Dependencia de factores externos
-        6. Innovación tecnológica y disrupciones
-        7. Sostenibilidad y responsabilidad social
+        Obsoleto: el flujo principal usa `_analizar_todo`; este método solo
+        se invoca si la respuesta agrupada no incluye la categoría.
+        """
+        prompt = self.PROMPT_LIQUIDEZ.format_map(self._variables_prompt(datos))
         
-        Evalúa cómo estos riesgos impactan específicamente a esta empresa.
-        Responde en formato JSON con análisis detallado.
+        return await self._analizar_categoria("liquidez", prompt, "análisis de liquidez", self._marca_tiempo(datos))
+    
+    async def _analizar_solvencia(self, datos: Dict) -> Dict:
         """
+        Analiza los indicadores de solvencia.
         
-        try:
-            logger.info("🔄 Solicitando análisis de riesgo sectorial a OpenAI...")
-            response = await self.openai_service.generar_respuesta_json(prompt)
-            
-            logger.debug(f"📥 Respuesta de OpenAI recibida: {response[:200]}...")
-            
-            # Verificar que la respuesta no esté vacía
-            if not response or response.strip() == "":
-                logger.error("❌ Respuesta vacía de OpenAI")
-                return {
-                    "categoria": "sectorial",
-                    "resultado": {
-                        "riesgos_identificados": [],
-                        "evaluacion": "No se pudo realizar el análisis por falta de respuesta del modelo",
-                        "nivel_riesgo": "MEDIO",
-                        "mitigaciones": ["Error en análisis automático"]
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            analisis = json.loads(response)
-            
-            # Verificar si hay error en la respuesta
-            if "error" in analisis:
-                logger.error(f"Error en respuesta de análisis sectorial: {analisis['error']}")
-                return {
-                    "categoria": "sectorial",
-                    "resultado": {
-                        "riesgos_identificados": [],
-                        "evaluacion": f"Error en análisis: {analisis.get('error', 'Desconocido')}",
-                        "nivel_riesgo": "MEDIO",
-                        "mitigaciones": ["Error en procesamiento"]
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            logger.success("✅ Análisis sectorial completado")
-            return {
-                "categoria": "sectorial",
-                "resultado": analisis,
-                "timestamp": datetime.now().isoformat()
-            }
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decodificando JSON en análisis sectorial: {str(e)}")
-            logger.debug(f"Respuesta que causó error: {response if 'response' in locals() else 'N/A'}")
-            return {
-                "categoria": "sectorial",
-                "resultado": {
-                    "riesgos_identificados": [],
-                    "evaluacion": "Error en formato de respuesta del modelo de IA",
-                    "nivel_riesgo": "MEDIO",
-                    "mitigaciones": ["Respuesta inválida del modelo"]
-                },
-                "timestamp": datetime.now().isoformat()
-            }
-        except Exception as e:
-            logger.error(f"Error en análisis sectorial: {str(e)}")
-            return {
-                "categoria": "sectorial",
-                "resultado": {
-                    "riesgos_identificados": [],
-                    "evaluacion": f"Error técnico: {str(e)}",
-                    "nivel_riesgo": "MEDIO",
-                    "mitigaciones": ["Error en procesamiento"]
-                },
-                "timestamp": datetime.now().isoformat()
-            }
+        Obsoleto: el flujo principal usa `_analizar_todo`; este método solo
+        se invoca si la respuesta agrupada no incluye la categoría.
+        """
+        prompt = self.PROMPT_SOLVENCIA.format_map(self._variables_prompt(datos))
+        
+        return await self._analizar_categoria("solvencia", prompt, "análisis de solvencia", self._marca_tiempo(datos))
     
-    async def _generar_calificacion_riesgo(self, analisis_resultados: Dict) -> Dict:
-        """Genera la calificación de riesgo global."""
-        prompt = f"""
-        Como analista senior de riesgos, basándote en los siguientes análisis:
+    async def _analizar_rentabilidad(self, datos: Dict) -> Dict:
+        """
+        Analiza los indicadores de rentabilidad.
         
-        LIQUIDEZ: {analisis_resultados.get('liquidez', {})}
-        SOLVENCIA: {analisis_resultados.get('solvencia', {})}
-        RENTABILIDAD: {analisis_resultados.get('rentabilidad', {})}
-        EFICIENCIA: {analisis_resultados.get('eficiencia', {})}
-        SECTORIAL: {analisis_resultados.get('sectorial', {})}
+        Obsoleto: el flujo principal usa `_analizar_todo`; este método solo
+        se invoca si la respuesta agrupada no incluye la categoría.
+        """
+        prompt = self.PROMPT_RENTABILIDAD.format_map(self._variables_prompt(datos))
         
-        Determina una calificación de riesgo global:
-        - BASICO: Riesgo bajo, empresa sólida, aprobación puede ser automática o con revisión mínima
-        - INTERMEDIO: Riesgo moderado, requiere análisis humano adicional
-        - AVANZADO: Riesgo alto, requiere análisis exhaustivo por especialista senior
+        return await self._analizar_categoria("rentabilidad", prompt, "análisis de rentabilidad", self._marca_tiempo(datos))
+    
+    async def _analizar_eficiencia(self, datos: Dict) -> Dict:
+        """
+        Analiza los indicadores de eficiencia operativa.
         
-        Proporciona:
-        1. Nivel de riesgo (BASICO/INTERMEDIO/AVANZADO)
-        2. Puntuación numérica (1-100)
-        3. Factores determinantes
-        4. Justificación detallada
+        Obsoleto: el flujo principal usa `_analizar_todo`; este método solo
+        se invoca si la respuesta agrupada no incluye la categoría.
+        """
+        prompt = self.PROMPT_EFICIENCIA.format_map(self._variables_prompt(datos))
         
-        Responde en formato JSON.
+        return await self._analizar_categoria("eficiencia", prompt, "análisis de eficiencia", self._marca_tiempo(datos))
+    
+    async def _analizar_riesgo_sectorial(self, datos: Dict) -> Dict:
         """
+        Analiza riesgos específicos del sector.
         
-        try:
-            logger.info("🔄 Solicitando calificación de riesgo global a OpenAI...")
-            response = await self.openai_service.generar_respuesta_json(prompt)
-            
-            logger.debug(f"📥 Respuesta de OpenAI recibida: {response[:200]}...")
+        Obsoleto: el flujo principal usa `_analizar_todo`; este método solo
+        se invoca si la respuesta agrupada no incluye la categoría.
+        """
+        prompt = self.PROMPT_SECTORIAL.format_map(self._variables_prompt(datos))
+        
+        return await self._analizar_categoria("sectorial", prompt, "análisis sectorial", self._marca_tiempo(datos))
+    
+    @staticmethod
+    def _resumir_categoria(categoria: str, resultado: Any) -> Dict:
+        """
+        Resume el resultado de una categoría a su nivel (con la clave propia
+        de la categoría, p. ej. riesgo_liquidez o nivel_rentabilidad), hasta 5
+        indicadores numéricos (o los 3 primeros riesgos identificados en la
+        sectorial) y sus 2 primeras observaciones.
+        
+        Args:
+            categoria: Categoría analizada
+            resultado: Resultado devuelto por el modelo
             
-            # Verificar que la respuesta no esté vacía
-            if not response or response.strip() == "":
-                logger.error("❌ Respuesta vacía de OpenAI")
-                return {
-                    "nivel": settings.DEFAULT_RISK_LEVEL,
-                    "puntuacion": 50,
-                    "factores": ["Error: No se pudo generar calificación"],
-                    "justificacion": "No se pudo completar la evaluación por falta de respuesta del modelo"
-                }
+        Returns:
+            Dict con el resumen compacto de la categoría
+        """
+        if not isinstance(resultado, dict):
+            resultado = {}
+        
+        clave_datos, _, clave_nivel, clave_lista = ESTRUCTURA_FALLBACK[categoria]
+        resumen = {clave_nivel: resultado.get(clave_nivel, "NO DISPONIBLE")}
+        
+        datos = resultado.get(clave_datos)
+        if isinstance(datos, dict):
+            indicadores = [
+                (nombre, valor) for nombre, valor in datos.items()
+                if isinstance(valor, (int, float)) and not isinstance(valor, bool)
+            ]
+            resumen["indicadores"] = dict(indicadores[:5])
+        elif isinstance(datos, list):
+            resumen["riesgos"] = [str(riesgo)[:120] for riesgo in datos[:3]]
+        
+        observaciones = resultado.get(clave_lista)
+        if isinstance(observaciones, list) and observaciones:
+            resumen["observaciones"] = [str(observacion)[:120] for observacion in observaciones[:2]]
+        
+        return resumen
+    
+    def _resumir_para_calificacion(self, analisis_resultados: Dict) -> Dict:
+        """
+        Reúne los resúmenes de cada categoría para el prompt de calificación.
+        
+        Args:
+            analisis_resultados: Resultados de los análisis por categoría
             
-            calificacion = json.loads(response)
+        Returns:
+            Dict categoría -> resumen compacto
+        """
+        resumen = {}
+        
+        for categoria in CATEGORIAS_ANALISIS:
+            entrada = analisis_resultados.get(categoria, {})
+            resumen[categoria] = entrada.get("resumen") or self._resumir_categoria(
+                categoria, entrada.get("resultado")
+            )
+        
+        return resumen
+    
+    async def _generar_calificacion_riesgo(
+        self,
+        analisis_resultados: Dict,
+        calificacion_previa: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Genera la calificación de riesgo global.
+        
+        Args:
+            analisis_resultados: Resultados de los análisis por categoría
+            calificacion_previa: Calificación ya devuelta por el análisis agrupado
             
-            # Verificar si hay error en la respuesta
-            if "error" in calificacion:
-                logger.error(f"Error en respuesta de calificación: {calificacion['error']}")
+        Returns:
+            Dict con nivel, puntuación, factores y justificación
+        """
+        resumen = self._resumir_para_calificacion(analisis_resultados)
+        
+        # Calificación directa solo si todas las categorías indican el mismo
+        # riesgo, leyendo el nivel de desempeño de rentabilidad y eficiencia
+        # como el riesgo opuesto (rentabilidad BAJA no confirma un riesgo BAJO)
+        niveles = set()
+        for categoria, entrada in resumen.items():
+            nivel_categoria = str(entrada.get(ESTRUCTURA_FALLBACK[categoria][2], "")).strip().upper()
+            if categoria not in CATEGORIAS_RIESGO:
+                nivel_categoria = RIESGO_POR_DESEMPEÑO.get(nivel_categoria, nivel_categoria)
+            niveles.add(nivel_categoria)
+        
+        if len(niveles) == 1:
+            nivel_comun = niveles.pop()
+            if nivel_comun in CALIFICACION_UNANIME:
+                nivel, puntuacion = CALIFICACION_UNANIME[nivel_comun]
+                logger.info(f"⚡ Riesgo {nivel_comun} en todas las categorías, calificación directa: {nivel}")
                 return {
-                    "nivel": settings.DEFAULT_RISK_LEVEL,
-                    "puntuacion": 50,
-                    "factores": ["Error en procesamiento"],
-                    "justificacion": f"Error en análisis: {calificacion.get('error', 'Desconocido')}"
+                    "nivel": nivel,
+                    "puntuacion": puntuacion,
+                    "factores": [f"Riesgo {nivel_comun} en {categoria}" for categoria in resumen],
+                    "justificacion": "Unánime en todas las categorías"
                 }
-            
-            logger.success("✅ Calificación de riesgo completada")
-            return calificacion
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decodificando JSON en calificación: {str(e)}")
-            logger.debug(f"Respuesta que causó error: {response if 'response' in locals() else 'N/A'}")
-            return {
-                "nivel": settings.DEFAULT_RISK_LEVEL,
-                "puntuacion": 50,
-                "factores": ["Error de formato"],
-                "justificacion": "Error en formato de respuesta del modelo"
-            }
-        except Exception as e:
-            logger.error(f"Error generando calificación: {str(e)}")
+        
+        if calificacion_previa:
+            return calificacion_previa
+        
+        prompt = self.PROMPT_CALIFICACION.format(resumen=volcar_json(resumen).decode("utf-8"))
+        
+        def calificacion_por_defecto(mensaje: str, observacion: str) -> Dict:
             return {
                 "nivel": settings.DEFAULT_RISK_LEVEL,
                 "puntuacion": 50,
-                "factores": ["Error en análisis automático"],
-                "justificacion": f"Error en el proceso: {str(e)}"
+                "factores": [observacion],
+                "justificacion": mensaje
             }
+        
+        return await self._solicitar_json_seguro(
+            prompt,
+            "calificación de riesgo global",
+            calificacion_por_defecto,
+            forzar_objeto=True,
+            esquema=Calificacion
+        )
     
     async def _generar_recomendaciones(self, calificacion: Dict, analisis: Dict) -> List[str]:
         """Genera recomendaciones basadas en el análisis."""
-        prompt = f"""
-        Basándote en la calificación de riesgo {calificacion} y el análisis detallado,
-        genera recomendaciones específicas y accionables para:
+        prompt = self.PROMPT_RECOMENDACIONES.format(calificacion=calificacion)
         
-        1. Mitigación de riesgos identificados
-        2. Mejoras en la gestión financiera
-        3. Aspectos a monitorear
-        4. Acciones correctivas sugeridas
-        5. Oportunidades de mejora
+        recomendaciones = await self._solicitar_json_seguro(
+            prompt,
+            "generación de recomendaciones",
+            lambda mensaje, observacion: {"recomendaciones": list(RECOMENDACIONES_POR_DEFECTO)},
+            forzar_objeto=True,
+            esquema=Recomendaciones
+        )
         
-        Proporciona entre 5-10 recomendaciones concretas.
-        Responde como lista de strings en formato JSON.
-        """
-        
-        try:
-            logger.info("🔄 Solicitando generación de recomendaciones a OpenAI...")
-            response = await self.openai_service.generar_respuesta_json(prompt)
-            
-            logger.debug(f"📥 Respuesta de OpenAI recibida: {response[:200]}...")
-            
-            # Verificar que la respuesta no esté vacía
-            if not response or response.strip() == "":
-                logger.error("❌ Respuesta vacía de OpenAI")
-                return [
-                    "Revisar estados financieros detalladamente",
-                    "Monitorear indicadores clave de liquidez",
-                    "Evaluar estructura de capital",
-                    "Verificar flujos de efectivo",
-                    "Analizar rentabilidad operativa"
-                ]
-            
-            recomendaciones = json.loads(response)
-            
-            # Verificar si hay error en la respuesta
-            if isinstance(recomendaciones, dict) and "error" in recomendaciones:
-                logger.error(f"Error en respuesta de recomendaciones: {recomendaciones['error']}")
-                return [
-                    "Revisar estados financieros detalladamente",
-                    "Monitorear indicadores clave",
-                    "Consultar con analista especializado"
-                ]
-            
-            logger.success("✅ Recomendaciones generadas")
-            return recomendaciones if isinstance(recomendaciones, list) else [str(recomendaciones)]
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decodificando JSON en recomendaciones: {str(e)}")
-            logger.debug(f"Respuesta que causó error: {response if 'response' in locals() else 'N/A'}")
-            return [
-                "Revisar estados financieros",
-                "Monitorear indicadores clave",
-                "Evaluar riesgos identificados"
-            ]
-        except Exception as e:
-            logger.error(f"Error generando recomendaciones: {str(e)}")
-            return [
-                "Revisar estados financieros",
-                "Monitorear indicadores clave"
-            ]
+        return recomendaciones["recomendaciones"]
     
-    def _determinar_perfil_aprobador(self, calificacion: Dict) -> Dict:
+    @staticmethod
+    def _determinar_perfil_aprobador(calificacion: Dict) -> Dict:
         """Determina qué perfil humano debe aprobar según el riesgo."""
         nivel = calificacion.get("nivel", "INTERMEDIO")
         
-        perfiles = {
-            "BASICO": {
-                "perfil": "Analista Junior",
-                "experiencia_minima": "1-2 años",
-                "especialidad": "Análisis básico de estados financieros",
-                "autoridad": "Hasta $100,000 USD",
-                "supervision": "Revisión por muestreo"
-            },
-            "INTERMEDIO": {
-                "perfil": "Analista Senior",
-                "experiencia_minima": "3-5 años",
-                "especialidad": "Análisis de riesgos y evaluación financiera",
-                "autoridad": "Hasta $500,000 USD",
-                "supervision": "Revisión por analista principal"
-            },
-            "AVANZADO": {
-                "perfil": "Especialista en Riesgos / Gerente",
-                "experiencia_minima": "5+ años",
-                "especialidad": "Análisis complejo de riesgos y decisiones estratégicas",
-                "autoridad": "Sin límite o comité de riesgos",
-                "supervision": "Revisión por comité ejecutivo"
-            }
-        }
-        
-        return perfiles.get(nivel, perfiles["INTERMEDIO"])
+        # Copia para que el reporte no comparta el diccionario del módulo
+        return dict(PERFILES_APROBADOR.get(nivel, PERFILES_APROBADOR["INTERMEDIO"]))
     
     async def _generar_resumen_ejecutivo(self, analisis: Dict, calificacion: Dict) -> str:
         """Genera un resumen ejecutivo del análisis."""
-        prompt = f"""
-        Genera un resumen ejecutivo profesional basado en:
-        
-        CALIFICACIÓN: {calificacion}
-        ANÁLISIS DETALLADO: {analisis}
-        
-        El resumen debe:
-        1. Ser conciso (máximo 300 palabras)
-        2. Destacar los puntos clave
-        3. Incluir la recomendación final
-        4. Ser comprensible para ejecutivos
-        5. Mencionar los principales riesgos y fortalezas
-        
-        Escribe en tono profesional y directo.
-        """
+        prompt = self.PROMPT_RESUMEN_EJECUTIVO.format(calificacion=calificacion, analisis=analisis)
         
         try:
-            response = await self.openai_service.generar_respuesta(prompt)
+            response = await self._generar_respuesta_texto_cacheada(prompt)
             return response
         except Exception as e:
             logger.error(f"Error generando resumen: {str(e)}")
             return "Resumen no disponible debido a error en el procesamiento."
     
+    def _rutas_analisis(self, session_id: str) -> List[Path]:
+        """Rutas posibles del análisis completo (comprimida primero, luego JSON plano)."""
+        archivo_analisis = self._output_dir / f"{session_id}_analisis_completo.json"
+        return [archivo_analisis.with_name(archivo_analisis.name + SUFIJO_COMPRIMIDO), archivo_analisis]
+    
     async def _guardar_analisis(self, session_id: str, reporte: Dict) -> None:
-        """Guarda el análisis completo en archivo JSON."""
-        archivo_analisis = Path(settings.OUTPUT_DIR) / f"{session_id}_analisis_completo.json"
+        """Guarda el análisis completo en archivo JSON (comprimido con zstd si está disponible, o compacto salvo en modo debug)."""
+        archivo_comprimido, archivo_plano = self._rutas_analisis(session_id)
         
         try:
-            with open(archivo_analisis, 'w', encoding='utf-8') as f:
-                json.dump(reporte, f, ensure_ascii=False, indent=2)
+            # Serialización (y compresión) fuera del event loop
+            if ZSTD_DISPONIBLE:
+                archivo_analisis = archivo_comprimido
+                contenido = await asyncio.to_thread(volcar_json_comprimido, reporte)
+            else:
+                archivo_analisis = archivo_plano
+                # Compacto por defecto; indentado solo con JSON_INDENT
+                contenido = await asyncio.to_thread(volcar_json, reporte, settings.JSON_INDENT)
+            
+            async with aiofiles.open(archivo_analisis, 'wb') as f:
+                await f.write(contenido)
+            
+            # Evitar que quede una versión anterior en el otro formato
+            if ZSTD_DISPONIBLE:
+                archivo_plano.unlink(missing_ok=True)
             
             logger.info(f"💾 Análisis guardado: {archivo_analisis}")
+            
+            await registrar_evaluacion(self._output_dir, reporte)
         except Exception as e:
             logger.error(f"Error guardando análisis: {str(e)}")
     
@@ -786,14 +1090,19 @@ class AnalistaRiesgos:
             Dict con información del documento generado
         """
         try:
-            # Cargar análisis completo
-            archivo_analisis = Path(settings.OUTPUT_DIR) / f"{session_id}_analisis_completo.json"
+            # Cargar análisis completo (comprimido o, si es anterior, JSON plano)
+            reporte = None
             
-            if not archivo_analisis.exists():
-                return {"error": "Análisis no encontrado"}
+            for archivo_analisis in self._rutas_analisis(session_id):
+                try:
+                    async with aiofiles.open(archivo_analisis, 'rb') as f:
+                        reporte = cargar_json_archivo(await f.read(), archivo_analisis)
+                    break
+                except FileNotFoundError:
+                    continue
             
-            with open(archivo_analisis, 'r', encoding='utf-8') as f:
-                reporte = json.load(f)
+            if reporte is None:
+                return {"error": "Análisis no encontrado"}
             
             # Generar PDF
             pdf_path = await self.report_generator.generar_reporte_pdf(reporte, session_id)
@@ -7,12 +7,13 @@ import asyncio
 from typing import Dict, Optional
 from pathlib import Path
 from datetime import datetime
-import json
 
 from services.openai_service import OpenAIService
 from services.file_service import FileService
 from utils.validators import DataValidator
-from config.settings import settings
+from utils.session_store import SessionStore
+from utils.serializacion import volcar_json, volcar_json_por_partes
+from config.settings import settings, INPUT_DIR_PATH
 from loguru import logger
 
 class SecretariaVirtual:
@@ -26,12 +27,42 @@ class SecretariaVirtual:
     - Gestionar la comunicación inicial con el usuario
     """
     
+    # Caracteres del PDF incluidos en el prompt de contexto
+    LONGITUD_CONTEXTO_PDF = 2000
+    
+    # Prompt de contexto que acompaña a los datos del análisis
+    PROMPT_CONTEXTO = """
+        ANÁLISIS FINANCIERO REQUERIDO
+        
+        INFORMACIÓN DE LA EMPRESA:
+        - Nombre: {nombre}
+        - Sector: {sector}
+        - Fecha de análisis: {fecha}
+        
+        CONTEXTO DEL SECTOR:
+        Empresa del sector {sector}. Considerar las particularidades y riesgos típicos de este sector.
+        
+        DOCUMENTO FINANCIERO:
+        El estado financiero contiene la siguiente información:
+        {contenido}...
+        
+        OBJETIVO DEL ANÁLISIS:
+        Realizar un análisis exhaustivo como analista senior de riesgos financieros, evaluando:
+        1. Liquidez y solvencia
+        2. Rentabilidad
+        3. Endeudamiento
+        4. Eficiencia operativa
+        5. Riesgos específicos del sector
+        
+        Proporcionar una calificación de riesgo: BÁSICO, INTERMEDIO o AVANZADO.
+        """
+    
     def __init__(self):
         """Inicializa la Secretaria Virtual."""
         self.openai_service = OpenAIService(api_key=settings.OPENAI_API_KEY_AGENTE1)
         self.file_service = FileService()
         self.validator = DataValidator()
-        self.session_data = {}
+        self.session_data = SessionStore()
         
         logger.info("🤖 Secretaria Virtual inicializada")
     
@@ -45,16 +76,17 @@ class SecretariaVirtual:
         Returns:
             Dict con información de la sesión
         """
-        session_id = f"session_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        ahora = datetime.now()
+        session_id = f"session_{user_id}_{ahora.strftime('%Y%m%d_%H%M%S')}"
         
-        self.session_data[session_id] = {
+        self.session_data.set(session_id, {
             "user_id": user_id,
-            "created_at": datetime.now().isoformat(),
+            "created_at": ahora.isoformat(),
             "status": "iniciada",
             "empresa": {},
             "archivos": [],
             "progreso": "recopilacion_datos"
-        }
+        })
         
         logger.info(f"📋 Nueva sesión iniciada: {session_id}")
         
@@ -76,7 +108,8 @@ class SecretariaVirtual:
         Returns:
             Dict con resultado de la validación
         """
-        if session_id not in self.session_data:
+        sesion = self.session_data.get(session_id)
+        if sesion is None:
             return {"error": "Sesión no encontrada"}
         
         # Validar datos de entrada
@@ -87,13 +120,14 @@ class SecretariaVirtual:
             return {"error": "Sector de empresa inválido"}
         
         # Guardar información
-        self.session_data[session_id]["empresa"] = {
+        sesion["empresa"] = {
             "nombre": nombre_empresa.strip(),
             "sector": sector_empresa.strip(),
             "fecha_registro": datetime.now().isoformat()
         }
         
-        self.session_data[session_id]["progreso"] = "informacion_recopilada"
+        sesion["progreso"] = "informacion_recopilada"
+        self.session_data.set(session_id, sesion)
         
         logger.info(f"🏢 Información de empresa registrada: {nombre_empresa} - {sector_empresa}")
         
@@ -114,24 +148,28 @@ class SecretariaVirtual:
         Returns:
             Dict con resultado del procesamiento
         """
-        if session_id not in self.session_data:
+        sesion = self.session_data.get(session_id)
+        if sesion is None:
             return {"error": "Sesión no encontrada"}
         
         try:
-            # Validar archivo
-            validacion = await self.file_service.validar_archivo_pdf(archivo_path)
+            # Validar archivo (abre el PDF, por eso se hace en un hilo)
+            validacion = await asyncio.to_thread(self.file_service.validar_archivo_pdf, archivo_path)
             if not validacion["valido"]:
                 return {"error": f"Archivo inválido: {validacion['razon']}"}
             
-            # Guardar archivo
-            archivo_guardado = await self.file_service.guardar_archivo_input(
+            # Guardar archivo con los bytes ya leídos al validarlo, sin volver
+            # a leer el original (la escritura también va en un hilo)
+            archivo_guardado = await asyncio.to_thread(
+                self.file_service.guardar_archivo_input,
                 archivo_path, 
                 session_id,
-                self.session_data[session_id]["empresa"]["nombre"]
+                sesion["empresa"]["nombre"],
+                validacion.pop("contenido")
             )
             
             # Actualizar sesión
-            self.session_data[session_id]["archivos"].append({
+            sesion["archivos"].append({
                 "path_original": archivo_path,
                 "path_guardado": archivo_guardado["path"],
                 "nombre_archivo": archivo_guardado["nombre"],
@@ -139,7 +177,8 @@ class SecretariaVirtual:
                 "fecha_subida": datetime.now().isoformat()
             })
             
-            self.session_data[session_id]["progreso"] = "archivo_procesado"
+            sesion["progreso"] = "archivo_procesado"
+            self.session_data.set(session_id, sesion)
             
             logger.info(f"📄 Archivo PDF procesado correctamente: {archivo_guardado['nombre']}")
             
@@ -164,11 +203,10 @@ class SecretariaVirtual:
         Returns:
             Dict con datos preparados para análisis
         """
-        if session_id not in self.session_data:
+        sesion = self.session_data.get(session_id)
+        if sesion is None:
             return {"error": "Sesión no encontrada"}
         
-        sesion = self.session_data[session_id]
-        
         if sesion["progreso"] != "archivo_procesado":
             return {"error": "Proceso incompleto. Falta información o archivo."}
         
@@ -176,9 +214,13 @@ class SecretariaVirtual:
             # Extraer texto del PDF
             archivo_info = sesion["archivos"][0]
             contenido_pdf = await self.file_service.extraer_texto_pdf(archivo_info["path_guardado"])
+            ahora = datetime.now()
             
-            # Preparar prompt especializado para el análisis
-            prompt_contexto = await self._generar_prompt_contexto(sesion["empresa"], contenido_pdf)
+            # Preparar prompt especializado para el análisis (solo con el
+            # inicio del documento; el texto completo va al archivo de datos)
+            prompt_contexto = self._generar_prompt_contexto(
+                sesion["empresa"], contenido_pdf[:self.LONGITUD_CONTEXTO_PDF], ahora
+            )
             
             # Guardar datos preparados
             datos_analisis = {
@@ -187,17 +229,17 @@ class SecretariaVirtual:
                 "archivo_financiero": archivo_info,
                 "contenido_extraido": contenido_pdf,
                 "prompt_contexto": prompt_contexto,
-                "fecha_preparacion": datetime.now().isoformat(),
+                "fecha_preparacion": ahora.isoformat(),
                 "estado": "listo_para_analisis"
             }
             
-            # Guardar en archivo JSON para el Agente 2
-            archivo_datos = Path(settings.INPUT_DIR) / f"{session_id}_datos_analisis.json"
-            with open(archivo_datos, 'w', encoding='utf-8') as f:
-                json.dump(datos_analisis, f, ensure_ascii=False, indent=2)
+            # Guardar en archivo JSON para el Agente 2 (fuera del event loop)
+            archivo_datos = INPUT_DIR_PATH / f"{session_id}_datos_analisis.json"
+            await asyncio.to_thread(self._escribir_datos_analisis, archivo_datos, datos_analisis)
             
             sesion["progreso"] = "datos_preparados"
             sesion["archivo_datos_analisis"] = str(archivo_datos)
+            self.session_data.set(session_id, sesion)
             
             logger.info(f"📊 Datos preparados para análisis: {session_id}")
             
@@ -212,44 +254,38 @@ class SecretariaVirtual:
             logger.error(f"❌ Error preparando datos para análisis: {str(e)}")
             return {"error": f"Error preparando datos: {str(e)}"}
     
-    async def _generar_prompt_contexto(self, empresa_info: Dict, contenido_pdf: str) -> str:
+    @staticmethod
+    def _escribir_datos_analisis(archivo_datos: Path, datos_analisis: Dict) -> None:
+        """
+        Escribe el archivo de datos para el Agente 2 (se ejecuta en un hilo).
+        
+        Se indenta solo con JSON_INDENT; si no, el texto del PDF se escribe
+        como una parte aparte, sin copiarlo dentro del documento completo.
+        """
+        with open(archivo_datos, 'wb') as f:
+            if settings.JSON_INDENT:
+                f.write(volcar_json(datos_analisis, indentado=True))
+            else:
+                f.writelines(volcar_json_por_partes(datos_analisis, "contenido_extraido"))
+    
+    def _generar_prompt_contexto(self, empresa_info: Dict, inicio_pdf: str, fecha: datetime) -> str:
         """
         Genera un prompt contextualizado para el análisis financiero.
         
         Args:
             empresa_info: Información de la empresa
-            contenido_pdf: Contenido extraído del PDF
+            inicio_pdf: Inicio del contenido extraído del PDF, ya recortado
+            fecha: Fecha de preparación del análisis
             
         Returns:
             Prompt especializado para el análisis
         """
-        prompt = f"""
-        ANÁLISIS FINANCIERO REQUERIDO
-        
-        INFORMACIÓN DE LA EMPRESA:
-        - Nombre: {empresa_info['nombre']}
-        - Sector: {empresa_info['sector']}
-        - Fecha de análisis: {datetime.now().strftime('%d/%m/%Y')}
-        
-        CONTEXTO DEL SECTOR:
-        Empresa del sector {empresa_info['sector']}. Considerar las particularidades y riesgos típicos de este sector.
-        
-        DOCUMENTO FINANCIERO:
-        El estado financiero contiene la siguiente información:
-        {contenido_pdf[:2000]}...
-        
-        OBJETIVO DEL ANÁLISIS:
-        Realizar un análisis exhaustivo como analista senior de riesgos financieros, evaluando:
-        1. Liquidez y solvencia
-        2. Rentabilidad
-        3. Endeudamiento
-        4. Eficiencia operativa
-        5. Riesgos específicos del sector
-        
-        Proporcionar una calificación de riesgo: BÁSICO, INTERMEDIO o AVANZADO.
-        """
-        
-        return prompt
+        return self.PROMPT_CONTEXTO.format_map({
+            "nombre": empresa_info['nombre'],
+            "sector": empresa_info['sector'],
+            "fecha": fecha.strftime('%d/%m/%Y'),
+            "contenido": inicio_pdf
+        })
     
     def obtener_resumen_sesion(self, session_id: str) -> Dict:
         """
@@ -261,11 +297,10 @@ class SecretariaVirtual:
         Returns:
             Dict con resumen de la sesión
         """
-        if session_id not in self.session_data:
+        sesion = self.session_data.get(session_id)
+        if sesion is None:
             return {"error": "Sesión no encontrada"}
         
-        sesion = self.session_data[session_id]
-        
         return {
             "session_id": session_id,
             "progreso": sesion["progreso"],
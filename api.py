@@ -3,25 +3,38 @@ API REST para el Sistema YaTeApruebo.
 Proporciona endpoints HTTP para integraciones externas.
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Query, Request, UploadFile, File, Form
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
+import aiofiles
 import uvicorn
-from typing import Optional
-import json
+from typing import Dict, List, Optional
 from pathlib import Path
 import tempfile
+import hashlib
+import importlib.util
+import shutil
 import os
 
 from main import YaTeApruebaSystem
-from config.settings import settings
+from services.openai_service import OpenAIService
+from config.settings import settings, INPUT_DIR_PATH, OUTPUT_DIR_PATH
+from utils.serializacion import (
+    cargar_json, contenido_json_archivo, volcar_json, JSONDecodeError,
+    ORJSON_DISPONIBLE, SUFIJO_COMPRIMIDO
+)
+from utils.indice_evaluaciones import leer_indice, eliminar_del_indice
+
+# Tamaño de bloque al copiar archivos subidos
+TAMANO_BLOQUE_COPIA = 64 * 1024
 
 # Crear aplicación FastAPI
 app = FastAPI(
     title="YaTeApruebo API",
     description="API REST para evaluación inteligente de estados financieros",
-    version=settings.VERSION
+    version=settings.VERSION,
+    default_response_class=ORJSONResponse if ORJSON_DISPONIBLE else JSONResponse
 )
 
 # Configurar CORS
@@ -36,12 +49,79 @@ app.add_middleware(
 # Instancia global del sistema
 sistema_global: Optional[YaTeApruebaSystem] = None
 
+# Límite de evaluaciones simultáneas en los lotes
+semaforo_evaluaciones = asyncio.Semaphore(settings.MAX_CONCURRENT_EVALS)
+
+# Ruta del reporte PDF de cada evaluación creada por esta instancia
+reportes_por_sesion: Dict[str, Path] = {}
+
+def _copiar_a_temporal(origen) -> str:
+    """Copia un archivo subido a un temporal .pdf por bloques y devuelve su ruta."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+        shutil.copyfileobj(origen, temp_file, length=TAMANO_BLOQUE_COPIA)
+        return temp_file.name
+
+def _etag_archivo(estado: os.stat_result) -> str:
+    """ETag de un archivo a partir de su fecha de modificación y tamaño."""
+    huella = f"{estado.st_mtime_ns}-{estado.st_size}".encode()
+    return f'"{hashlib.blake2b(huella, digest_size=16).hexdigest()}"'
+
+def _etag_coincide(request: Request, etag: str) -> bool:
+    """Indica si el cliente ya tiene la versión actual (cabecera If-None-Match)."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    
+    etiquetas = {etiqueta.strip() for etiqueta in if_none_match.split(",")}
+    return bool(etiquetas & {"*", etag, f"W/{etag}"})
+
+def _proyectar_json(contenido: bytes, campos: List[str]) -> bytes:
+    """Devuelve solo los campos de primer nivel indicados de un objeto JSON."""
+    documento = cargar_json(contenido)
+    return volcar_json({campo: documento[campo] for campo in campos if campo in documento})
+
+def _archivos_de_sesion(directorio: Path, session_id: str) -> List[os.DirEntry]:
+    """
+    Busca con un solo recorrido del directorio los archivos de una sesión:
+    JSON que empiezan por el ID y PDF/TXT que lo contienen.
+    """
+    encontrados = []
+    
+    try:
+        with os.scandir(directorio) as entradas:
+            for entrada in entradas:
+                nombre = entrada.name
+                if session_id not in nombre or not entrada.is_file():
+                    continue
+                if nombre.startswith(session_id) and nombre.endswith((".json", ".json" + SUFIJO_COMPRIMIDO)):
+                    encontrados.append(entrada)
+                elif nombre.endswith((".pdf", ".txt")):
+                    encontrados.append(entrada)
+    except FileNotFoundError:
+        pass
+    
+    return encontrados
+
 @app.on_event("startup")
 async def startup_event():
     """Inicializa el sistema al arrancar la API."""
     global sistema_global
     sistema_global = YaTeApruebaSystem()
     await sistema_global.inicializar_servicios()
+    
+    # Cargar el índice de evaluaciones en memoria antes de la primera consulta
+    await leer_indice(OUTPUT_DIR_PATH)
+    
+    # Abrir las conexiones con OpenAI antes de la primera evaluación
+    await OpenAIService.precalentar_conexiones([
+        settings.OPENAI_API_KEY_AGENTE1,
+        settings.OPENAI_SEGUNDO_AGENTE
+    ])
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Cierra las conexiones compartidas al detener la API."""
+    await OpenAIService.cerrar_conexiones()
 
 @app.get("/")
 async def root():
@@ -66,10 +146,63 @@ async def health_check():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en health check: {str(e)}")
 
+async def _evaluar_pdf(nombre_empresa: str, sector_empresa: str, archivo_pdf: UploadFile) -> Dict:
+    """
+    Valida, guarda temporalmente y evalúa un PDF subido.
+    
+    Args:
+        nombre_empresa: Nombre de la empresa a evaluar
+        sector_empresa: Sector de la empresa
+        archivo_pdf: Archivo PDF con el estado financiero
+        
+    Returns:
+        Resultado de la evaluación sin los datos de gran tamaño
+        
+    Raises:
+        HTTPException: Si el archivo no es válido o la evaluación falla
+    """
+    # Validar archivo PDF
+    if not archivo_pdf.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Solo se aceptan archivos PDF")
+    
+    if archivo_pdf.size is not None and archivo_pdf.size > settings.MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail="Archivo muy grande")
+    
+    # Guardar archivo temporal copiándolo por bloques desde el archivo
+    # subido, sin cargar el PDF completo en memoria
+    temp_file_path = await asyncio.to_thread(_copiar_a_temporal, archivo_pdf.file)
+    
+    try:
+        # Procesar evaluación
+        resultado = await sistema_global.procesar_evaluacion_directa(
+            nombre_empresa=nombre_empresa,
+            sector_empresa=sector_empresa,
+            archivo_pdf=temp_file_path
+        )
+        
+        if "error" in resultado:
+            raise HTTPException(status_code=400, detail=resultado["error"])
+        
+        reportes_por_sesion[resultado["session_id"]] = Path(resultado["pdf_path"])
+        
+        # Remover datos muy grandes de la respuesta
+        return {
+            "success": resultado["success"],
+            "session_id": resultado["session_id"],
+            "empresa": resultado["empresa"],
+            "calificacion_riesgo": resultado["calificacion_riesgo"],
+            "pdf_path": resultado["pdf_path"],
+            "resumen": resultado["reporte_completo"].get("resumen_ejecutivo", "No disponible")
+        }
+        
+    finally:
+        # Limpiar archivo temporal
+        await asyncio.to_thread(os.unlink, temp_file_path)
+
 @app.post("/evaluacion")
 async def crear_evaluacion(
-    nombre_empresa: str = Form(...),
-    sector_empresa: str = Form(...),
+    nombre_empresa: str = Form(..., min_length=3, max_length=200),
+    sector_empresa: str = Form(..., min_length=3, max_length=100),
     archivo_pdf: UploadFile = File(...)
 ):
     """
@@ -86,52 +219,65 @@ async def crear_evaluacion(
     if not sistema_global:
         raise HTTPException(status_code=503, detail="Sistema no inicializado")
     
-    # Validar archivo PDF
-    if not archivo_pdf.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Solo se aceptan archivos PDF")
-    
-    if archivo_pdf.size > settings.MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="Archivo muy grande")
-    
     try:
-        # Guardar archivo temporal
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            content = await archivo_pdf.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-        
-        try:
-            # Procesar evaluación
-            resultado = await sistema_global.procesar_evaluacion_directa(
-                nombre_empresa=nombre_empresa,
-                sector_empresa=sector_empresa,
-                archivo_pdf=temp_file_path
-            )
-            
-            if "error" in resultado:
-                raise HTTPException(status_code=400, detail=resultado["error"])
-            
-            # Remover datos muy grandes de la respuesta
-            resultado_limpio = {
-                "success": resultado["success"],
-                "session_id": resultado["session_id"],
-                "empresa": resultado["empresa"],
-                "calificacion_riesgo": resultado["calificacion_riesgo"],
-                "pdf_path": resultado["pdf_path"],
-                "resumen": resultado["reporte_completo"].get("resumen_ejecutivo", "No disponible")
-            }
-            
-            return resultado_limpio
-            
-        finally:
-            # Limpiar archivo temporal
-            os.unlink(temp_file_path)
-            
+        return await _evaluar_pdf(nombre_empresa, sector_empresa, archivo_pdf)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error procesando evaluación: {str(e)}")
 
+@app.post("/evaluaciones/batch")
+async def crear_evaluaciones_lote(
+    empresas: str = Form(...),
+    archivos: List[UploadFile] = File(...)
+):
+    """
+    Crea varias evaluaciones financieras en una sola petición.
+    
+    Las evaluaciones se procesan en paralelo, con un máximo de
+    settings.MAX_CONCURRENT_EVALS simultáneas.
+    
+    Args:
+        empresas: Array JSON de objetos {"nombre", "sector"}, uno por archivo
+        archivos: Archivos PDF en el mismo orden que `empresas`
+        
+    Returns:
+        JSON Lines con un resultado (o error) por archivo, en el orden recibido
+    """
+    if not sistema_global:
+        raise HTTPException(status_code=503, detail="Sistema no inicializado")
+    
+    try:
+        lista_empresas = cargar_json(empresas)
+    except JSONDecodeError:
+        raise HTTPException(status_code=400, detail="El campo empresas debe ser un array JSON")
+    
+    if not isinstance(lista_empresas, list) or len(lista_empresas) != len(archivos):
+        raise HTTPException(status_code=400, detail="Debe indicarse una empresa por cada archivo")
+    
+    async def evaluar(indice: int, archivo: UploadFile, empresa: Dict) -> Dict:
+        async with semaforo_evaluaciones:
+            try:
+                resultado = await _evaluar_pdf(empresa.get("nombre", ""), empresa.get("sector", ""), archivo)
+            except HTTPException as e:
+                resultado = {"error": e.detail}
+            except Exception as e:
+                resultado = {"error": f"Error procesando evaluación: {str(e)}"}
+        
+        return {"indice": indice, "archivo": archivo.filename, **resultado}
+    
+    resultados = await asyncio.gather(*(
+        evaluar(indice, archivo, empresa if isinstance(empresa, dict) else {})
+        for indice, (archivo, empresa) in enumerate(zip(archivos, lista_empresas))
+    ))
+    
+    return Response(
+        content=b"".join(volcar_json(resultado) + b"\n" for resultado in resultados),
+        media_type="application/x-ndjson"
+    )
+
 @app.get("/evaluacion/{session_id}/reporte")
-async def descargar_reporte(session_id: str):
+async def descargar_reporte(session_id: str, request: Request):
     """
     Descarga el reporte PDF de una evaluación.
     
@@ -142,22 +288,34 @@ async def descargar_reporte(session_id: str):
         Archivo PDF del reporte
     """
     try:
-        # Buscar archivo de reporte
-        output_dir = Path(settings.OUTPUT_DIR)
-        archivos_reporte = list(output_dir.glob(f"Reporte_Financiero_*{session_id}*.pdf"))
+        # Buscar archivo de reporte (ruta conocida o un recorrido del directorio)
+        archivo_reporte = reportes_por_sesion.get(session_id)
         
-        if not archivos_reporte:
-            raise HTTPException(status_code=404, detail="Reporte no encontrado")
+        if archivo_reporte is None or not archivo_reporte.exists():
+            archivos_reporte = [
+                entrada for entrada in _archivos_de_sesion(OUTPUT_DIR_PATH, session_id)
+                if entrada.name.startswith("Reporte_Financiero_") and entrada.name.endswith(".pdf")
+            ]
+            
+            if not archivos_reporte:
+                raise HTTPException(status_code=404, detail="Reporte no encontrado")
+            
+            # Tomar el más reciente
+            archivo_reporte = Path(max(archivos_reporte, key=lambda entrada: entrada.stat().st_mtime).path)
+            reportes_por_sesion[session_id] = archivo_reporte
         
-        archivo_reporte = archivos_reporte[0]  # Tomar el más reciente
+        estado = archivo_reporte.stat()
+        etag = _etag_archivo(estado)
         
-        if not archivo_reporte.exists():
-            raise HTTPException(status_code=404, detail="Archivo de reporte no encontrado")
+        if _etag_coincide(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
         
         return FileResponse(
             archivo_reporte,
             media_type='application/pdf',
-            filename=archivo_reporte.name
+            filename=archivo_reporte.name,
+            headers={"ETag": etag},
+            stat_result=estado
         )
         
     except HTTPException:
@@ -166,28 +324,58 @@ async def descargar_reporte(session_id: str):
         raise HTTPException(status_code=500, detail=f"Error descargando reporte: {str(e)}")
 
 @app.get("/evaluacion/{session_id}/detalle")
-async def obtener_detalle_evaluacion(session_id: str):
+async def obtener_detalle_evaluacion(
+    session_id: str,
+    request: Request,
+    campos: Optional[str] = Query(None, description="Campos de primer nivel separados por comas")
+):
     """
     Obtiene los detalles completos de una evaluación.
     
     Args:
         session_id: ID de la sesión
+        campos: Campos a devolver, p. ej. "calificacion_riesgo,resumen_ejecutivo" (opcional)
         
     Returns:
-        Detalles completos de la evaluación
+        Detalles completos de la evaluación (o solo los campos pedidos)
     """
     try:
         # Buscar archivo de análisis completo
-        output_dir = Path(settings.OUTPUT_DIR)
-        archivo_analisis = output_dir / f"{session_id}_analisis_completo.json"
+        archivo_analisis = OUTPUT_DIR_PATH / f"{session_id}_analisis_completo.json"
+        archivo_comprimido = archivo_analisis.with_name(archivo_analisis.name + SUFIJO_COMPRIMIDO)
         
-        if not archivo_analisis.exists():
+        contenido = None
+        
+        for archivo in (archivo_comprimido, archivo_analisis):
+            try:
+                estado = archivo.stat()
+                etag = _etag_archivo(estado)
+                
+                # El cliente ya tiene esta versión: no hace falta leer el archivo
+                if _etag_coincide(request, etag):
+                    return Response(status_code=304, headers={"ETag": etag})
+                
+                async with aiofiles.open(archivo, 'rb') as f:
+                    contenido = await f.read()
+                archivo_analisis = archivo
+                break
+            except FileNotFoundError:
+                continue
+        
+        if contenido is None:
             raise HTTPException(status_code=404, detail="Análisis no encontrado")
         
-        with open(archivo_analisis, 'r', encoding='utf-8') as f:
-            analisis_completo = json.load(f)
+        # El archivo ya es JSON: se envía tal cual, sin decodificarlo y volver
+        # a codificarlo (solo se descomprime, fuera del event loop, si hace falta)
+        if archivo_analisis.name.endswith(SUFIJO_COMPRIMIDO):
+            contenido = await asyncio.to_thread(contenido_json_archivo, contenido, archivo_analisis)
+        
+        # Con campos solo se codifica la parte pedida (a menudo muy pequeña)
+        if campos:
+            lista_campos = [campo.strip() for campo in campos.split(",") if campo.strip()]
+            contenido = await asyncio.to_thread(_proyectar_json, contenido, lista_campos)
         
-        return analisis_completo
+        return Response(content=contenido, media_type="application/json", headers={"ETag": etag})
         
     except HTTPException:
         raise
@@ -209,30 +397,8 @@ async def obtener_estadisticas():
 async def listar_evaluaciones():
     """Lista todas las evaluaciones realizadas."""
     try:
-        output_dir = Path(settings.OUTPUT_DIR)
-        archivos_analisis = list(output_dir.glob("*_analisis_completo.json"))
-        
-        evaluaciones = []
-        
-        for archivo in archivos_analisis:
-            try:
-                with open(archivo, 'r', encoding='utf-8') as f:
-                    analisis = json.load(f)
-                
-                evaluaciones.append({
-                    "session_id": analisis.get("session_id"),
-                    "empresa": analisis.get("empresa", {}).get("nombre"),
-                    "sector": analisis.get("empresa", {}).get("sector"),
-                    "fecha_analisis": analisis.get("fecha_analisis"),
-                    "calificacion_riesgo": analisis.get("calificacion_riesgo", {}).get("nivel"),
-                    "puntuacion": analisis.get("calificacion_riesgo", {}).get("puntuacion")
-                })
-                
-            except Exception:
-                continue  # Saltar archivos corruptos
-        
-        # Ordenar por fecha más reciente
-        evaluaciones.sort(key=lambda x: x["fecha_analisis"] or "", reverse=True)
+        # El índice ya viene ordenado por fecha más reciente
+        evaluaciones = await leer_indice(OUTPUT_DIR_PATH)
         
         return {
             "total": len(evaluaciones),
@@ -254,32 +420,22 @@ async def eliminar_evaluacion(session_id: str):
         Confirmación de eliminación
     """
     try:
-        output_dir = Path(settings.OUTPUT_DIR)
-        input_dir = Path(settings.INPUT_DIR)
-        
         archivos_eliminados = []
         
-        # Buscar y eliminar archivos relacionados
-        patrones = [
-            f"{session_id}*.json",
-            f"*{session_id}*.pdf",
-            f"*{session_id}*.txt"
-        ]
-        
-        for patron in patrones:
-            # Buscar en output
-            for archivo in output_dir.glob(patron):
-                archivo.unlink()
-                archivos_eliminados.append(str(archivo))
-            
-            # Buscar en input
-            for archivo in input_dir.glob(patron):
-                archivo.unlink()
-                archivos_eliminados.append(str(archivo))
+        # Buscar y eliminar archivos relacionados (un recorrido por directorio)
+        for directorio in (OUTPUT_DIR_PATH, INPUT_DIR_PATH):
+            entradas = await asyncio.to_thread(_archivos_de_sesion, directorio, session_id)
+            archivos_eliminados.extend(entrada.path for entrada in entradas)
+        
+        await asyncio.gather(*(asyncio.to_thread(os.unlink, archivo) for archivo in archivos_eliminados))
+        
+        reportes_por_sesion.pop(session_id, None)
         
         if not archivos_eliminados:
             raise HTTPException(status_code=404, detail="Evaluación no encontrada")
         
+        await eliminar_del_indice(OUTPUT_DIR_PATH, session_id)
+        
         return {
             "mensaje": "Evaluación eliminada exitosamente",
             "archivos_eliminados": archivos_eliminados
@@ -301,11 +457,20 @@ def iniciar_api_server(host: str = "0.0.0.0", port: int = 8000):
     print(f"🚀 Iniciando API YaTeApruebo en http://{host}:{port}")
     print(f"📚 Documentación disponible en http://{host}:{port}/docs")
     
+    # uvloop y httptools vienen con uvicorn[standard]; si faltan (p. ej. en
+    # Windows) se usan las implementaciones puras de Python
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    
     uvicorn.run(
         "api:app",
+        app_dir=str(Path(__file__).parent),  # Para importar "api" desde cualquier directorio
         host=host,
         port=port,
-        reload=settings.DEBUG,
+        reload=settings.API_RELOAD,
+        workers=1 if settings.API_RELOAD else settings.API_WORKERS,
+        loop=loop,
+        http=http,
         log_level="info"
     )
 
@@ -4,15 +4,27 @@ Maneja variables de entorno y configuraciones globales.
 """
 
 import os
+from dataclasses import dataclass
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import List
+from typing import Tuple
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Directorios ya creados en este proceso por create_directories
+_directorios_creados = False
+
+# Copia única del entorno: los valores por defecto de Settings se leen de aquí
+_ENTORNO = dict(os.environ)
+
+def _lista(nombre: str, defecto: str) -> Tuple[str, ...]:
+    """Lee una variable de entorno separada por comas como tupla."""
+    return tuple(_ENTORNO.get(nombre, defecto).split(","))
+
+@dataclass(frozen=True)
 class Settings:
-    """Configuraciones del sistema YaTeApruebo."""
+    """Configuraciones del sistema YaTeApruebo (inmutables una vez creadas)."""
     
     # Información del proyecto
     PROJECT_NAME: str = "YaTeApruebo"
@@ -20,45 +32,65 @@ class Settings:
     DESCRIPTION: str = "Sistema de evaluación inteligente de estados financieros"
     
     # Configuración de Telegram
-    TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
+    TELEGRAM_BOT_TOKEN: str = _ENTORNO.get("TELEGRAM_BOT_TOKEN", "")
     
     # Configuración de OpenAI
-    OPENAI_API_KEY_AGENTE1: str = os.getenv("OPENAI_API_KEY_AGENTE1", "")
-    OPENAI_SEGUNDO_AGENTE: str = os.getenv("OPENAI_SEGUNDO_AGENTE", "")
-    OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4-turbo-preview")
-    MAX_TOKENS: int = int(os.getenv("MAX_TOKENS", "4096"))
-    TEMPERATURE: float = float(os.getenv("TEMPERATURE", "0.3"))
+    OPENAI_API_KEY_AGENTE1: str = _ENTORNO.get("OPENAI_API_KEY_AGENTE1", "")
+    OPENAI_SEGUNDO_AGENTE: str = _ENTORNO.get("OPENAI_SEGUNDO_AGENTE", "")
+    OPENAI_MODEL: str = _ENTORNO.get("OPENAI_MODEL", "gpt-4-turbo-preview")
+    MAX_TOKENS: int = int(_ENTORNO.get("MAX_TOKENS", "4096"))
+    TEMPERATURE: float = float(_ENTORNO.get("TEMPERATURE", "0.3"))
+    CONTEXT_TOKEN_BUDGET: int = int(_ENTORNO.get("CONTEXT_TOKEN_BUDGET", "400"))
+    OPENAI_MAX_RETRIES: int = int(_ENTORNO.get("OPENAI_MAX_RETRIES", "4"))
+    OPENAI_MAX_CONCURRENCY: int = int(_ENTORNO.get("OPENAI_MAX_CONCURRENCY", "8"))
     
     # Configuración de directorios
     BASE_DIR: Path = Path(__file__).parent.parent
-    LOCAL_STORAGE_PATH: str = os.getenv("LOCAL_STORAGE_PATH", "./data")
-    INPUT_DIR: str = os.getenv("INPUT_DIR", "./data/input")
-    OUTPUT_DIR: str = os.getenv("OUTPUT_DIR", "./data/output")
-    LOGS_DIR: str = os.getenv("LOGS_DIR", "./data/logs")
+    LOCAL_STORAGE_PATH: str = _ENTORNO.get("LOCAL_STORAGE_PATH", "./data")
+    INPUT_DIR: str = _ENTORNO.get("INPUT_DIR", "./data/input")
+    OUTPUT_DIR: str = _ENTORNO.get("OUTPUT_DIR", "./data/output")
+    LOGS_DIR: str = _ENTORNO.get("LOGS_DIR", "./data/logs")
+    CACHE_DIR: str = _ENTORNO.get("CACHE_DIR", "./data/cache")
+    SESSIONS_DB: str = _ENTORNO.get("SESSIONS_DB", "./data/sessions.db")
     
     # Configuración de archivos
-    MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
-    ALLOWED_FILE_TYPES: List[str] = os.getenv("ALLOWED_FILE_TYPES", "pdf").split(",")
+    MAX_FILE_SIZE: int = int(_ENTORNO.get("MAX_FILE_SIZE", "10485760"))  # 10MB
+    ALLOWED_FILE_TYPES: Tuple[str, ...] = _lista("ALLOWED_FILE_TYPES", "pdf")
+    MAX_CONCURRENT_EVALS: int = int(_ENTORNO.get("MAX_CONCURRENT_EVALS", "3"))
     
     # Configuración de logging
-    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
-    DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
+    LOG_LEVEL: str = _ENTORNO.get("LOG_LEVEL", "INFO")
+    DEBUG: bool = _ENTORNO.get("DEBUG", "False").lower() == "true"
+    LOG_SOURCE: bool = _ENTORNO.get("LOG_SOURCE", "False").lower() == "true"
+    
+    # Formato de los JSON escritos en disco (indentados solo para depurar)
+    JSON_INDENT: bool = _ENTORNO.get("JSON_INDENT", "False").lower() == "true"
+    
+    # Configuración del servidor de la API
+    API_RELOAD: bool = _ENTORNO.get("YATE_RELOAD", "False").lower() == "true"
+    API_WORKERS: int = int(_ENTORNO.get("WORKERS", "1"))
     
     # Configuración de análisis de riesgo
-    RISK_LEVELS: List[str] = os.getenv("RISK_LEVELS", "BASICO,INTERMEDIO,AVANZADO").split(",")
-    DEFAULT_RISK_LEVEL: str = os.getenv("DEFAULT_RISK_LEVEL", "INTERMEDIO")
+    RISK_LEVELS: Tuple[str, ...] = _lista("RISK_LEVELS", "BASICO,INTERMEDIO,AVANZADO")
+    DEFAULT_RISK_LEVEL: str = _ENTORNO.get("DEFAULT_RISK_LEVEL", "INTERMEDIO")
+    
+    # Configuración de sesiones
+    SESSION_CACHE_SIZE: int = int(_ENTORNO.get("SESSION_CACHE_SIZE", "256"))
+    
+    # Configuración de caché de respuestas de OpenAI
+    LLM_CACHE_ENABLED: bool = _ENTORNO.get("LLM_CACHE_ENABLED", "True").lower() == "true"
+    LLM_CACHE_TTL_DAYS: int = int(_ENTORNO.get("LLM_CACHE_TTL_DAYS", "30"))
     
     # Configuración futura de Supabase
-    SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
-    SUPABASE_ANON_KEY: str = os.getenv("SUPABASE_ANON_KEY", "")
+    SUPABASE_URL: str = _ENTORNO.get("SUPABASE_URL", "")
+    SUPABASE_ANON_KEY: str = _ENTORNO.get("SUPABASE_ANON_KEY", "")
     
-    @classmethod
-    def validate_config(cls) -> bool:
+    def validate_config(self) -> bool:
         """Valida que las configuraciones críticas estén presentes."""
         required_vars = [
-            cls.TELEGRAM_BOT_TOKEN,
-            cls.OPENAI_API_KEY_AGENTE1,
-            cls.OPENAI_SEGUNDO_AGENTE
+            self.TELEGRAM_BOT_TOKEN,
+            self.OPENAI_API_KEY_AGENTE1,
+            self.OPENAI_SEGUNDO_AGENTE
         ]
         
         missing_vars = [var for var in required_vars if not var]
@@ -70,23 +102,32 @@ class Settings:
         print("✅ Configuración validada correctamente")
         return True
     
-    @classmethod
-    def create_directories(cls) -> None:
-        """Crea los directorios necesarios si no existen."""
+    def create_directories(self) -> None:
+        """Crea los directorios necesarios si no existen (una vez por proceso)."""
+        global _directorios_creados
+        if _directorios_creados:
+            return
+        
         directories = [
-            cls.INPUT_DIR,
-            cls.OUTPUT_DIR,
-            cls.LOGS_DIR
+            self.INPUT_DIR,
+            self.OUTPUT_DIR,
+            self.LOGS_DIR,
+            self.CACHE_DIR
         ]
         
         for directory in directories:
             Path(directory).mkdir(parents=True, exist_ok=True)
         
+        _directorios_creados = True
         print("✅ Directorios creados/verificados correctamente")
 
 # Instancia global de configuración
 settings = Settings()
 
+# Rutas de trabajo ya construidas (evita repetir Path(settings.X) en cada petición)
+INPUT_DIR_PATH = Path(settings.INPUT_DIR)
+OUTPUT_DIR_PATH = Path(settings.OUTPUT_DIR)
+
 # Validar configuración al importar
 if __name__ == "__main__":
     settings.validate_config()
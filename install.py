@@ -6,18 +6,26 @@ Instala dependencias y configura el entorno.
 
 import os
 import sys
+import shutil
 import subprocess
 from pathlib import Path
 
-def ejecutar_comando(comando, descripcion):
-    """Ejecuta un comando y maneja errores."""
+# Caché de pip del proyecto (descargas y wheels ya construidos)
+DIRECTORIO_CACHE_PIP = Path("data/.pip-cache")
+
+def ejecutar_comando(argv, descripcion):
+    """
+    Ejecuta un comando (lista de argumentos, sin shell) y maneja errores.
+    
+    La salida estándar se muestra directamente en la terminal; solo se
+    captura la salida de error para informarla si el comando falla.
+    """
     print(f"🔧 {descripcion}...")
     try:
-        result = subprocess.run(
-            comando, 
-            shell=True, 
-            check=True, 
-            capture_output=True, 
+        subprocess.run(
+            argv,
+            check=True,
+            stderr=subprocess.PIPE,
             text=True
         )
         print(f"✅ {descripcion} completado")
@@ -44,16 +52,29 @@ def instalar_dependencias():
     """Instala las dependencias del proyecto."""
     print("📦 Instalando dependencias...")
     
+    # Con uv disponible se usa su resolvedor y descargas en paralelo
+    uv = shutil.which("uv")
+    if uv:
+        return ejecutar_comando(
+            [uv, "pip", "install", "--python", sys.executable, "-r", "requirements.txt"],
+            "Instalando dependencias desde requirements.txt (uv)"
+        )
+    
     # Actualizar pip
     if not ejecutar_comando(
-        f"{sys.executable} -m pip install --upgrade pip",
+        [sys.executable, "-m", "pip", "install", "--upgrade", "pip"],
         "Actualizando pip"
     ):
         return False
     
     # Instalar requirements
     if not ejecutar_comando(
-        f"{sys.executable} -m pip install -r requirements.txt",
+        [
+            sys.executable, "-m", "pip", "install",
+            "--prefer-binary",
+            "--cache-dir", str(DIRECTORIO_CACHE_PIP.resolve()),
+            "-r", "requirements.txt"
+        ],
         "Instalando dependencias desde requirements.txt"
     ):
         return False
@@ -64,15 +85,14 @@ def crear_directorios():
     """Crea los directorios necesarios."""
     print("📁 Creando directorios necesarios...")
     
-    directorios = [
-        "data/input",
-        "data/output", 
-        "data/logs"
-    ]
+    # Todos cuelgan de data/: se crea una vez y luego solo cada subdirectorio
+    directorio_base = Path("data")
+    directorio_base.mkdir(exist_ok=True)
     
-    for directorio in directorios:
-        Path(directorio).mkdir(parents=True, exist_ok=True)
-        print(f"✅ Directorio creado: {directorio}")
+    for nombre in ("input", "output", "logs", DIRECTORIO_CACHE_PIP.name):
+        directorio = directorio_base / nombre
+        directorio.mkdir(exist_ok=True)
+        print(f"✅ Directorio creado: {directorio.as_posix()}")
     
     return True
 
@@ -96,19 +116,32 @@ def verificar_archivo_env():
     
     # Verificar que las variables críticas estén presentes
     try:
-        with open(env_path, 'r') as f:
-            contenido = f.read()
-            
         variables_criticas = [
             "TELEGRAM_BOT_TOKEN",
             "OPENAI_API_KEY_AGENTE1", 
             "OPENAI_SEGUNDO_AGENTE"
         ]
         
-        variables_faltantes = []
-        for var in variables_criticas:
-            if var not in contenido or f"{var}=your_" in contenido:
-                variables_faltantes.append(var)
+        # Leer el archivo línea a línea (ignorando comentarios) hasta encontrar
+        # todas las variables críticas
+        env = {}
+        with open(env_path, 'r', encoding='utf-8') as f:
+            for linea in f:
+                linea = linea.strip()
+                if linea.startswith("#") or "=" not in linea:
+                    continue
+                
+                clave, valor = linea.split("=", 1)
+                clave = clave.strip()
+                if clave in variables_criticas:
+                    env[clave] = valor.strip()
+                    if len(env) == len(variables_criticas):
+                        break
+        
+        variables_faltantes = [
+            var for var in variables_criticas
+            if not env.get(var) or env[var].startswith("your_")
+        ]
         
         if variables_faltantes:
             print("⚠️ Variables de entorno no configuradas:")
@@ -150,21 +183,33 @@ def verificar_instalacion():
 
 def mostrar_instrucciones_finales():
     """Muestra las instrucciones finales de uso."""
-    print("\n" + "="*60)
-    print("🎉 ¡INSTALACIÓN COMPLETADA!")
-    print("="*60)
-    print("\n📋 Para usar el sistema:")
-    print("\n1. 🤖 Iniciar el bot de Telegram:")
-    print("   python main.py")
-    print("\n2. 🧪 Ejecutar pruebas:")
-    print("   python test_system.py")
-    print("\n3. 📊 Ver estadísticas:")
-    print("   python -c \"from main import YaTeApruebaSystem; s = YaTeApruebaSystem(); print(s.obtener_estadisticas_sistema())\"")
-    print("\n4. 📚 Documentación:")
-    print("   Ver README.md para más detalles")
-    print("\n" + "="*60)
-    print("💡 Tip: Usa 'Ctrl+C' para detener el sistema")
-    print("="*60)
+    separador = "=" * 60
+    print(f"""
+{separador}
+🎉 ¡INSTALACIÓN COMPLETADA!
+{separador}
+
+📋 Para usar el sistema:
+
+1. 🤖 Iniciar el bot de Telegram:
+   python main.py
+
+2. 🧪 Ejecutar pruebas:
+   python test_system.py
+
+3. 📊 Ver estadísticas:
+   python -c "from main import YaTeApruebaSystem; s = YaTeApruebaSystem(); print(s.obtener_estadisticas_sistema())"
+
+4. 📦 Caché de dependencias (reinstalaciones más rápidas):
+   {DIRECTORIO_CACHE_PIP}
+   Para instalar aún más rápido: pip install uv (el instalador lo detecta)
+
+5. 📚 Documentación:
+   Ver README.md para más detalles
+
+{separador}
+💡 Tip: Usa 'Ctrl+C' para detener el sistema
+{separador}""")
 
 def main():
     """Función principal de instalación."""
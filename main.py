@@ -6,36 +6,56 @@ Sistema de evaluación inteligente de estados financieros con dos agentes de IA.
 import asyncio
 import sys
 import signal
+from collections import Counter
+from secrets import token_hex
 from typing import Optional
 from pathlib import Path
 
-# Agregar el directorio raíz al path para imports
-sys.path.append(str(Path(__file__).parent))
-
-from config.settings import settings
+from config.settings import settings, OUTPUT_DIR_PATH
 from services.telegram_service import TelegramService
+from services.openai_service import OpenAIService
 from agents.secretaria_virtual import SecretariaVirtual
 from agents.analista_riesgos import AnalistaRiesgos
+from services.file_service import FileService
+from utils.indice_evaluaciones import cargar_indice
 
-# Configurar logging
 from loguru import logger
 
-# Configurar logger
-logger.remove()  # Remover handler por defecto
-logger.add(
-    sys.stdout,
-    level=settings.LOG_LEVEL,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    colorize=True
-)
-logger.add(
-    Path(settings.LOGS_DIR) / "yateapruebo_{time:YYYY-MM-DD}.log",
-    level=settings.LOG_LEVEL,
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-    rotation="1 day",
-    retention="30 days",
-    compression="zip"
-)
+# Sinks de loguru ya configurados en este proceso
+_logging_configurado = False
+
+def configurar_logging() -> None:
+    """
+    Configura los sinks de loguru (consola y archivo diario), una sola vez.
+    
+    Se llama al crear el sistema y no al importar el módulo, para que importar
+    main desde otras herramientas no tenga efectos secundarios.
+    """
+    global _logging_configurado
+    if _logging_configurado:
+        return
+    
+    # El origen (módulo:función:línea) en el archivo de log solo si se pide
+    origen = " | {name}:{function}:{line}" if settings.LOG_SOURCE else ""
+    
+    logger.remove()  # Remover handler por defecto
+    logger.add(
+        sys.stdout,
+        level=settings.LOG_LEVEL,
+        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
+        colorize=sys.stdout.isatty()  # Sin colores al redirigir a archivo o servicio
+    )
+    logger.add(
+        Path(settings.LOGS_DIR) / "yateapruebo_{time:YYYY-MM-DD}.log",
+        level=settings.LOG_LEVEL,
+        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8}" + origen + " - {message}",
+        rotation="1 day",
+        retention="30 days",
+        compression="zip",
+        enqueue=True  # Escritura en segundo plano, fuera de los handlers
+    )
+    
+    _logging_configurado = True
 
 class YaTeApruebaSystem:
     """
@@ -45,25 +65,33 @@ class YaTeApruebaSystem:
     para proporcionar evaluación inteligente de estados financieros.
     """
     
+    # Configuración validada y directorios creados en este proceso
+    _configuracion_verificada = False
+    
     def __init__(self):
         """Inicializa el sistema YaTeApruebo."""
+        configurar_logging()
         logger.info("🚀 Inicializando Sistema YaTeApruebo")
         
-        # Validar configuración
-        if not settings.validate_config():
-            logger.error("❌ Configuración inválida. Revisa las variables de entorno.")
-            sys.exit(1)
-        
-        # Crear directorios necesarios
-        settings.create_directories()
+        # Validar configuración y crear directorios (una vez por proceso)
+        if not YaTeApruebaSystem._configuracion_verificada:
+            if not settings.validate_config():
+                logger.error("❌ Configuración inválida. Revisa las variables de entorno.")
+                sys.exit(1)
+            
+            settings.create_directories()
+            YaTeApruebaSystem._configuracion_verificada = True
         
         # Inicializar servicios
         self.telegram_service: Optional[TelegramService] = None
         self.secretaria: Optional[SecretariaVirtual] = None
         self.analista: Optional[AnalistaRiesgos] = None
+        self._file_service: Optional[FileService] = None  # Solo para estadísticas
         
         # Estado del sistema
         self.running = False
+        self._tarea_detencion: Optional[asyncio.Task] = None
+        self._evento_detencion: Optional[asyncio.Event] = None
         
         logger.info("✅ Sistema YaTeApruebo inicializado correctamente")
     
@@ -78,7 +106,8 @@ class YaTeApruebaSystem:
             
             # Inicializar servicio de Telegram solo si está configurado
             if settings.TELEGRAM_BOT_TOKEN and settings.TELEGRAM_BOT_TOKEN != "tu_token_aqui":
-                self.telegram_service = TelegramService()
+                # Reutiliza los agentes del sistema en lugar de crear otros
+                self.telegram_service = TelegramService(self.secretaria, self.analista)
                 logger.info("✅ Telegram bot configurado")
             else:
                 self.telegram_service = None
@@ -89,123 +118,6 @@ class YaTeApruebaSystem:
         except Exception as e:
             logger.error(f"❌ Error inicializando servicios: {str(e)}")
             raise
-
-    async def procesar_evaluacion_directa(self, nombre_empresa: str, sector_empresa: str, archivo_pdf: str):
-        """
-        Procesa una evaluación directamente sin Telegram (para uso con API).
-        
-        Args:
-            nombre_empresa: Nombre de la empresa
-            sector_empresa: Sector de la empresa
-            archivo_pdf: Ruta al archivo PDF
-            
-        Returns:
-            dict: Resultado de la evaluación completa
-        """
-        try:
-            # Generar session_id único
-            import uuid
-            session_id = str(uuid.uuid4())[:8]
-            
-            logger.info(f"🔄 Iniciando evaluación directa para {nombre_empresa} (ID: {session_id})")
-            
-            # Crear datos de empresa simulando input de usuario
-            datos_empresa = {
-                "nombre": nombre_empresa,
-                "sector": sector_empresa,
-                "session_id": session_id
-            }
-            
-            # Paso 1: Procesar PDF con la secretaria
-            resultado_pdf = await self.secretaria.procesar_pdf(archivo_pdf, datos_empresa)
-            
-            if not resultado_pdf.get("success"):
-                return {"error": f"Error procesando PDF: {resultado_pdf.get('error', 'Desconocido')}"}
-            
-            # Paso 2: Realizar análisis con analista de riesgos
-            resultado_analisis = await self.analista.realizar_analisis_completo(
-                contenido_pdf=resultado_pdf["contenido_procesado"],
-                datos_empresa=datos_empresa
-            )
-            
-            if not resultado_analisis.get("success"):
-                return {"error": f"Error en análisis: {resultado_analisis.get('error', 'Desconocido')}"}
-            
-            # Paso 3: Generar reporte
-            reporte_resultado = await self.analista.generar_reporte_final(
-                analisis_completo=resultado_analisis["analisis_completo"],
-                datos_empresa=datos_empresa
-            )
-            
-            if not reporte_resultado.get("success"):
-                return {"error": f"Error generando reporte: {reporte_resultado.get('error', 'Desconocido')}"}
-            
-            # Compilar resultado final
-            resultado_final = {
-                "success": True,
-                "session_id": session_id,
-                "empresa": datos_empresa,
-                "contenido_pdf": resultado_pdf["contenido_procesado"],
-                "analisis_completo": resultado_analisis["analisis_completo"],
-                "calificacion_riesgo": resultado_analisis["analisis_completo"]["calificacion_riesgo"],
-                "reporte_completo": reporte_resultado["reporte_completo"],
-                "pdf_path": reporte_resultado["pdf_path"]
-            }
-            
-            # Guardar análisis completo para futuras consultas
-            import json
-            from pathlib import Path
-            output_dir = Path(settings.OUTPUT_DIR)
-            archivo_analisis = output_dir / f"{session_id}_analisis_completo.json"
-            
-            with open(archivo_analisis, 'w', encoding='utf-8') as f:
-                json.dump(resultado_final, f, indent=2, ensure_ascii=False)
-            
-            logger.info(f"✅ Evaluación directa completada para {nombre_empresa}")
-            return resultado_final
-            
-        except Exception as e:
-            logger.error(f"❌ Error en evaluación directa: {e}")
-            return {"error": str(e)}
-
-    def obtener_estadisticas_sistema(self):
-        """Obtiene estadísticas básicas del sistema."""
-        try:
-            from pathlib import Path
-            import json
-            
-            output_dir = Path(settings.OUTPUT_DIR)
-            archivos_analisis = list(output_dir.glob("*_analisis_completo.json"))
-            
-            total_evaluaciones = len(archivos_analisis)
-            evaluaciones_por_nivel = {"BÁSICO": 0, "INTERMEDIO": 0, "AVANZADO": 0}
-            
-            for archivo in archivos_analisis:
-                try:
-                    with open(archivo, 'r', encoding='utf-8') as f:
-                        analisis = json.load(f)
-                    
-                    nivel = analisis.get("calificacion_riesgo", {}).get("nivel")
-                    if nivel in evaluaciones_por_nivel:
-                        evaluaciones_por_nivel[nivel] += 1
-                        
-                except Exception:
-                    continue
-            
-            return {
-                "total_evaluaciones": total_evaluaciones,
-                "evaluaciones_por_nivel": evaluaciones_por_nivel,
-                "servicios_activos": {
-                    "openai": True,  # Asumimos que está activo si el sistema se inició
-                    "telegram": self.telegram_service is not None,
-                    "file_service": True
-                },
-                "version": settings.VERSION
-            }
-            
-        except Exception as e:
-            logger.error(f"Error obteniendo estadísticas: {e}")
-            return {}
     
     async def iniciar_sistema(self) -> None:
         """Inicia el sistema completo."""
@@ -218,6 +130,10 @@ class YaTeApruebaSystem:
             # Inicializar servicios
             await self.inicializar_servicios()
             
+            # Evento que despierta al sistema cuando se pide la detención
+            # (se crea aquí para quedar ligado al loop en ejecución)
+            self._evento_detencion = asyncio.Event()
+            
             # Configurar manejo de señales
             self._configurar_señales()
             
@@ -253,39 +169,67 @@ class YaTeApruebaSystem:
             if self.telegram_service:
                 await self.telegram_service.detener_bot()
             
+            # Cerrar el pool de conexiones compartido con OpenAI
+            await OpenAIService.cerrar_conexiones()
+            
             logger.info("✅ Sistema YaTeApruebo detenido correctamente")
             
         except Exception as e:
             logger.error(f"❌ Error deteniendo sistema: {str(e)}")
+        finally:
+            # El evento se activa al terminar: si se activara antes, la tarea
+            # principal acabaría y asyncio.run cancelaría esta detención a medias
+            if self._evento_detencion is not None:
+                self._evento_detencion.set()
     
     def _mostrar_info_sistema(self) -> None:
-        """Muestra información del sistema al iniciar."""
-        logger.info("=" * 60)
-        logger.info(f"🏦 SISTEMA YATEAPRUEBO v{settings.VERSION}")
-        logger.info(f"📄 {settings.DESCRIPTION}")
-        logger.info("=" * 60)
-        logger.info(f"🔧 Modo Debug: {'Activado' if settings.DEBUG else 'Desactivado'}")
-        logger.info(f"📊 Modelo OpenAI: {settings.OPENAI_MODEL}")
-        logger.info(f"📁 Directorio Input: {settings.INPUT_DIR}")
-        logger.info(f"📁 Directorio Output: {settings.OUTPUT_DIR}")
-        logger.info(f"📝 Directorio Logs: {settings.LOGS_DIR}")
-        logger.info(f"🎯 Niveles de Riesgo: {', '.join(settings.RISK_LEVELS)}")
-        logger.info("=" * 60)
+        """Muestra información del sistema al iniciar (en un único registro)."""
+        separador = "=" * 60
+        logger.info("\n".join([
+            "",
+            separador,
+            f"🏦 SISTEMA YATEAPRUEBO v{settings.VERSION}",
+            f"📄 {settings.DESCRIPTION}",
+            separador,
+            f"🔧 Modo Debug: {'Activado' if settings.DEBUG else 'Desactivado'}",
+            f"📊 Modelo OpenAI: {settings.OPENAI_MODEL}",
+            f"📁 Directorio Input: {settings.INPUT_DIR}",
+            f"📁 Directorio Output: {settings.OUTPUT_DIR}",
+            f"📝 Directorio Logs: {settings.LOGS_DIR}",
+            f"🎯 Niveles de Riesgo: {', '.join(settings.RISK_LEVELS)}",
+            separador
+        ]))
     
     def _configurar_señales(self) -> None:
-        """Configura el manejo de señales del sistema."""
-        def signal_handler(signum, frame):
+        """
+        Configura el manejo de señales del sistema.
+        
+        Las señales se atienden dentro del event loop (loop.add_signal_handler);
+        en Windows, donde no está disponible, el manejador de signal solo
+        programa la detención en el loop de forma segura.
+        """
+        loop = asyncio.get_running_loop()
+        
+        def programar_detencion(signum: int) -> None:
             logger.info(f"📡 Señal {signum} recibida. Iniciando apagado ordenado...")
-            asyncio.create_task(self.detener_sistema())
+            # Se guarda la referencia para que la tarea no se pierda antes de terminar
+            self._tarea_detencion = loop.create_task(self.detener_sistema())
         
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
+        for señal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(señal, programar_detencion, señal)
+            except NotImplementedError:
+                signal.signal(
+                    señal,
+                    lambda signum, frame: loop.call_soon_threadsafe(programar_detencion, signum)
+                )
     
     async def _mantener_ejecutando(self) -> None:
         """Mantiene el sistema ejecutándose hasta recibir señal de parada."""
         try:
-            while self.running:
-                await asyncio.sleep(1)
+            # Sin despertares periódicos: se espera hasta que detener_sistema
+            # active el evento
+            await self._evento_detencion.wait()
         except asyncio.CancelledError:
             logger.info("🔄 Tarea principal cancelada")
     
@@ -314,8 +258,9 @@ class YaTeApruebaSystem:
             if not self.secretaria or not self.analista:
                 await self.inicializar_servicios()
             
-            # Simular ID de usuario para modo directo
-            user_id = "direct_mode"
+            # Simular ID de usuario para modo directo; el sufijo aleatorio evita
+            # que dos evaluaciones del mismo segundo compartan session_id
+            user_id = f"direct_{token_hex(4)}"
             
             # 1. Iniciar sesión con Secretaria Virtual
             resultado_sesion = await self.secretaria.iniciar_sesion(user_id)
@@ -373,11 +318,14 @@ class YaTeApruebaSystem:
         Returns:
             Dict con estadísticas del sistema
         """
-        from services.file_service import FileService
-        
         try:
-            file_service = FileService()
-            stats_storage = file_service.obtener_estadisticas_storage()
+            # El servicio se crea una sola vez (verifica directorios al crearse)
+            if self._file_service is None:
+                self._file_service = FileService()
+            stats_storage = self._file_service.obtener_estadisticas_storage()
+            
+            # Conteo de evaluaciones desde el índice (sin abrir cada análisis)
+            registros = cargar_indice(OUTPUT_DIR_PATH) or []
             
             return {
                 "version": settings.VERSION,
@@ -388,6 +336,10 @@ class YaTeApruebaSystem:
                     "max_tokens": settings.MAX_TOKENS,
                     "temperature": settings.TEMPERATURE
                 },
+                "evaluaciones": {
+                    "total": len(registros),
+                    "por_nivel": dict(Counter(registro.get("calificacion_riesgo") for registro in registros))
+                },
                 "almacenamiento": stats_storage,
                 "directorios": {
                     "input": settings.INPUT_DIR,
@@ -405,8 +357,20 @@ async def main():
     sistema = YaTeApruebaSystem()
     await sistema.iniciar_sistema()
 
+def _configurar_event_loop() -> None:
+    """Usa uvloop como event loop si está instalado (no existe en Windows)."""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.debug("⚡ Event loop: uvloop")
+
 def main_sync():
     """Función principal síncrona para compatibilidad."""
+    _configurar_event_loop()
+    
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -4,12 +4,8 @@ Script para ejecutar solo la API REST del Sistema YaTeApruebo.
 """
 
 import asyncio
-import os
 import sys
 
-# Agregar el directorio raíz al path
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
 def main():
     """Función principal para ejecutar la API."""
     try:
@@ -1,7 +1,19 @@
 """Servicios del sistema YaTeApruebo."""
 
-from .openai_service import OpenAIService
-from .file_service import FileService  
-from .telegram_service import TelegramService
+import importlib
 
-__all__ = ["OpenAIService", "FileService", "TelegramService"]
\ No newline at end of file
+# Los servicios se importan al primer acceso (PEP 562): importar un
+# submódulo concreto no carga las dependencias de los demás
+_MODULOS = {
+    "OpenAIService": "openai_service",
+    "FileService": "file_service",
+    "TelegramService": "telegram_service"
+}
+
+__all__ = ["OpenAIService", "FileService", "TelegramService"]
+
+def __getattr__(nombre):
+    """Importa el submódulo de la clase pedida la primera vez que se usa."""
+    if nombre in _MODULOS:
+        return getattr(importlib.import_module(f".{_MODULOS[nombre]}", __name__), nombre)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
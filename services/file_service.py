@@ -3,16 +3,103 @@ Servicio de gestión de archivos.
 Maneja la carga, validación y procesamiento de archivos PDF.
 """
 
+import asyncio
+import hashlib
+import io
+import multiprocessing
 import os
+import re
 import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Dict, Optional
-import PyPDF2
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from datetime import datetime
 
+try:
+    import blake3  # Hash vectorizado y multihilo, bastante más rápido que SHA-1
+except ImportError:
+    blake3 = None
+
 from config.settings import settings
 from loguru import logger
 
+# Por debajo de este número de páginas no compensa repartir la extracción
+# entre procesos (el coste de enviar el trabajo supera al de extraer)
+PAGINAS_MINIMAS_PARALELO = 4
+MAX_PROCESOS_EXTRACCION = min(4, os.cpu_count() or 1)
+
+# Limpieza de nombres de archivo: los espacios pasan a "_" y se descarta todo
+# lo que no sea letra, número, guion o guion bajo (\w incluye letras acentuadas)
+PATRON_ESPACIOS = re.compile(r"\s")
+PATRON_CARACTERES_NO_VALIDOS = re.compile(r"[^\w\-]")
+
+# Cualquier tramo de espacios que contenga un salto de línea: al sustituirlo
+# por "\n" se recortan las líneas y se eliminan las vacías en una pasada
+PATRON_SALTOS_LINEA = re.compile(r"\s*\n\s*")
+
+# Longitud máxima del texto que se envía a análisis (~50k caracteres, para no
+# exceder los límites de tokens) y prefijo que se limpia antes que el texto
+# completo cuando este es más largo
+LIMITE_TEXTO_ANALISIS = 50000
+LONGITUD_PREFIJO_LIMPIEZA = 60000
+
+_pool_extraccion: Optional[ProcessPoolExecutor] = None
+
+# PyMuPDF (o PyPDF2 si no está instalado) se importa la primera vez que se
+# abre un PDF, de modo que listar, eliminar o contar archivos no paga su coste
+# de importación
+fitz = None
+PyPDF2 = None
+_motor_pdf_cargado = False
+
+def _cargar_motor_pdf() -> None:
+    """Importa la librería de lectura de PDF la primera vez que se necesita."""
+    global fitz, PyPDF2, _motor_pdf_cargado
+    if _motor_pdf_cargado:
+        return
+    
+    try:
+        import fitz as _fitz  # PyMuPDF: extracción de texto en C, mucho más rápida que PyPDF2
+        fitz = _fitz
+    except ImportError:
+        import PyPDF2 as _PyPDF2
+        PyPDF2 = _PyPDF2
+    
+    _motor_pdf_cargado = True
+
+def _obtener_pool_extraccion() -> ProcessPoolExecutor:
+    """
+    Devuelve el pool de procesos de extracción, creándolo la primera vez.
+    
+    Los procesos se crean con "spawn" y no con fork: el proceso principal ya
+    tiene hilos en marcha (executor de asyncio, hilo de loguru con enqueue) y
+    un fork podría heredar sus locks tomados.
+    """
+    global _pool_extraccion
+    if _pool_extraccion is None:
+        _pool_extraccion = ProcessPoolExecutor(
+            max_workers=MAX_PROCESOS_EXTRACCION,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool_extraccion
+
+def _descartar_pool_extraccion(pool: ProcessPoolExecutor) -> None:
+    """Descarta un pool roto para que la próxima extracción cree uno nuevo."""
+    global _pool_extraccion
+    if _pool_extraccion is pool:
+        _pool_extraccion = None
+    pool.shutdown(wait=False)
+
+def _extraer_paginas(archivo_path: str, inicio: int, fin: int) -> List[Optional[str]]:
+    """
+    Extrae el texto de las páginas [inicio, fin) de un PDF con PyMuPDF.
+    
+    Es una función de módulo para poder ejecutarse en otro proceso.
+    """
+    return list(FileService._textos_paginas(archivo_path, inicio, fin))
+
 class FileService:
     """
     Servicio para gestión de archivos del sistema YaTeApruebo.
@@ -29,6 +116,7 @@ class FileService:
         self.input_dir = Path(settings.INPUT_DIR)
         self.output_dir = Path(settings.OUTPUT_DIR)
         self.logs_dir = Path(settings.LOGS_DIR)
+        self.cache_pdf_dir = Path(settings.CACHE_DIR) / "pdf"
         
         # Crear directorios si no existen
         self._crear_directorios()
@@ -37,12 +125,12 @@ class FileService:
     
     def _crear_directorios(self) -> None:
         """Crea los directorios necesarios si no existen."""
-        for directory in [self.input_dir, self.output_dir, self.logs_dir]:
+        for directory in [self.input_dir, self.output_dir, self.logs_dir, self.cache_pdf_dir]:
             directory.mkdir(parents=True, exist_ok=True)
         
         logger.debug("📂 Directorios verificados/creados")
     
-    async def validar_archivo_pdf(self, archivo_path: str) -> Dict:
+    def validar_archivo_pdf(self, archivo_path: str) -> Dict:
         """
         Valida que el archivo sea un PDF válido y cumpla los requisitos.
         
@@ -50,7 +138,8 @@ class FileService:
             archivo_path: Ruta del archivo a validar
             
         Returns:
-            Dict con resultado de la validación
+            Dict con resultado de la validación; si es válido incluye en
+            "contenido" los bytes leídos, para guardarlos sin releer el archivo
         """
         try:
             archivo = Path(archivo_path)
@@ -79,27 +168,24 @@ class FileService:
                     "razon": f"Archivo muy grande ({tamaño_mb:.1f}MB). Límite: {limite_mb:.1f}MB"
                 }
             
-            # Verificar que es un PDF válido
+            # Verificar que es un PDF válido (el archivo se lee una sola vez y
+            # se analiza desde memoria)
             try:
-                with open(archivo_path, 'rb') as f:
-                    pdf_reader = PyPDF2.PdfReader(f)
-                    num_paginas = len(pdf_reader.pages)
-                    
-                    if num_paginas == 0:
-                        return {
-                            "valido": False,
-                            "razon": "El PDF no contiene páginas"
-                        }
-                    
-                    # Verificar que se puede extraer texto
-                    primera_pagina = pdf_reader.pages[0]
-                    texto_muestra = primera_pagina.extract_text()
-                    
-                    if len(texto_muestra.strip()) < 10:
-                        return {
-                            "valido": False,
-                            "razon": "El PDF no contiene texto extraíble (posiblemente escaneado)"
-                        }
+                contenido = archivo.read_bytes()
+                num_paginas, texto_muestra = self._muestra_pdf(contenido)
+                
+                if num_paginas == 0:
+                    return {
+                        "valido": False,
+                        "razon": "El PDF no contiene páginas"
+                    }
+                
+                # Verificar que se puede extraer texto
+                if len(texto_muestra.strip()) < 10:
+                    return {
+                        "valido": False,
+                        "razon": "El PDF no contiene texto extraíble (posiblemente escaneado)"
+                    }
                         
             except Exception as e:
                 return {
@@ -114,7 +200,8 @@ class FileService:
                 "archivo": archivo.name,
                 "tamaño": tamaño_archivo,
                 "num_paginas": num_paginas,
-                "ruta": str(archivo)
+                "ruta": str(archivo),
+                "contenido": contenido
             }
             
         except Exception as e:
@@ -124,11 +211,12 @@ class FileService:
                 "razon": f"Error inesperado: {str(e)}"
             }
     
-    async def guardar_archivo_input(
+    def guardar_archivo_input(
         self, 
         archivo_path: str, 
         session_id: str,
-        nombre_empresa: str
+        nombre_empresa: str,
+        contenido: Optional[bytes] = None
     ) -> Dict:
         """
         Guarda el archivo en el directorio de input con nombre estandarizado.
@@ -137,6 +225,8 @@ class FileService:
             archivo_path: Ruta del archivo original
             session_id: ID de la sesión
             nombre_empresa: Nombre de la empresa
+            contenido: Bytes del archivo ya leídos (opcional; se escriben
+                directamente en lugar de copiar el original)
             
         Returns:
             Dict con información del archivo guardado
@@ -152,8 +242,11 @@ class FileService:
             # Ruta de destino
             ruta_destino = self.input_dir / nuevo_nombre
             
-            # Copiar archivo
-            shutil.copy2(archivo_original, ruta_destino)
+            # Escribir o copiar archivo
+            if contenido is not None:
+                ruta_destino.write_bytes(contenido)
+            else:
+                shutil.copy2(archivo_original, ruta_destino)
             
             # Verificar que se copió correctamente
             if not ruta_destino.exists():
@@ -192,65 +285,231 @@ class FileService:
             Exception: Si hay error extrayendo el texto
         """
         try:
-            with open(archivo_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                texto_completo = ""
-                
-                for num_pagina, pagina in enumerate(pdf_reader.pages):
-                    try:
-                        texto_pagina = pagina.extract_text()
-                        texto_completo += f"\n--- PÁGINA {num_pagina + 1} ---\n"
-                        texto_completo += texto_pagina
-                        texto_completo += "\n"
-                    except Exception as e:
-                        logger.warning(f"⚠️ Error extrayendo página {num_pagina + 1}: {str(e)}")
-                        continue
-                
-                # Limpiar texto
-                texto_limpio = self._limpiar_texto(texto_completo)
-                
-                logger.info(f"📖 Texto extraído: {len(texto_limpio)} caracteres")
-                
-                return texto_limpio
+            # El texto ya limpio se guarda en caché según el hash del archivo,
+            # así un mismo PDF reanalizado no se vuelve a procesar. El archivo
+            # se lee una sola vez: los mismos bytes sirven para el hash y para
+            # extraer el texto
+            contenido, huella = await asyncio.to_thread(self._leer_con_huella, archivo_path)
+            texto_cache = await asyncio.to_thread(self._leer_cache_texto, huella)
+            
+            if texto_cache is not None:
+                logger.debug(f"🗄️ Texto del PDF obtenido de caché ({huella[:12]})")
+                return texto_cache
+            
+            textos = await self._extraer_textos(archivo_path, contenido)
+            
+            # Las partes se acumulan en una lista y se unen una sola vez
+            partes = []
+            
+            for num_pagina, texto_pagina in enumerate(textos):
+                if texto_pagina is None:
+                    continue
+                partes.append(f"\n--- PÁGINA {num_pagina + 1} ---\n")
+                partes.append(texto_pagina)
+                partes.append("\n")
+            
+            # Limpiar texto
+            texto_limpio = self._limpiar_texto("".join(partes))
+            await asyncio.to_thread(self._guardar_cache_texto, huella, texto_limpio)
+            
+            logger.info(f"📖 Texto extraído: {len(texto_limpio)} caracteres")
+            
+            return texto_limpio
                 
         except Exception as e:
             logger.error(f"❌ Error extrayendo texto del PDF: {str(e)}")
             raise Exception(f"Error procesando PDF: {str(e)}")
     
+    @staticmethod
+    def _leer_con_huella(archivo_path: str) -> Tuple[bytes, str]:
+        """
+        Lee un archivo completo y devuelve su contenido junto con su hash
+        (BLAKE3 si está instalado, SHA-1 en caso contrario; las huellas tienen
+        distinta longitud, así que las entradas de caché no se mezclan).
+        """
+        contenido = Path(archivo_path).read_bytes()
+        
+        if blake3 is not None:
+            return contenido, blake3.blake3(contenido, max_threads=blake3.blake3.AUTO).hexdigest()
+        
+        return contenido, hashlib.sha1(contenido).hexdigest()
+    
+    def _leer_cache_texto(self, huella: str) -> Optional[str]:
+        """
+        Lee de la caché el texto extraído y limpio de un PDF.
+        
+        Se guarda como UTF-8 plano: una lectura y una sola decodificación, sin
+        parsear JSON ni volver a unir y limpiar las páginas.
+        
+        Args:
+            huella: Hash del contenido del PDF
+        
+        Returns:
+            Texto del PDF o None si no está en caché
+        """
+        try:
+            return (self.cache_pdf_dir / f"{huella}.txt").read_bytes().decode("utf-8", "surrogatepass")
+        except FileNotFoundError:
+            return None
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"⚠️ Error leyendo caché de PDF {huella[:12]}: {str(e)}")
+            return None
+    
+    def _guardar_cache_texto(self, huella: str, texto: str) -> None:
+        """
+        Guarda en la caché el texto extraído y limpio de un PDF.
+        
+        Se escribe en un archivo temporal que luego se renombra, igual que en
+        la caché de respuestas del modelo.
+        """
+        ruta = self.cache_pdf_dir / f"{huella}.txt"
+        temporal = None
+        
+        try:
+            # Nombre único: dos extracciones del mismo PDF no comparten temporal
+            descriptor, temporal = tempfile.mkstemp(dir=self.cache_pdf_dir, suffix=".tmp")
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(texto.encode("utf-8", "surrogatepass"))
+            os.replace(temporal, ruta)
+        except OSError as e:
+            if temporal is not None:
+                Path(temporal).unlink(missing_ok=True)
+            logger.warning(f"⚠️ Error guardando caché de PDF {huella[:12]}: {str(e)}")
+    
+    @staticmethod
+    async def _extraer_textos(archivo_path: str, contenido: bytes) -> List[Optional[str]]:
+        """
+        Extrae el texto de todas las páginas fuera del event loop.
+        
+        Con PyMuPDF y documentos de varias páginas reparte rangos contiguos de
+        páginas entre un pool de procesos (que abren el archivo por su ruta);
+        en otro caso las recorre en serie en un hilo desde `contenido`, sin
+        volver a leer el disco.
+        """
+        _cargar_motor_pdf()
+        
+        if fitz is not None:
+            with FileService._abrir_fitz(contenido) as doc:
+                num_paginas = doc.page_count
+            
+            if num_paginas >= PAGINAS_MINIMAS_PARALELO and MAX_PROCESOS_EXTRACCION > 1:
+                loop = asyncio.get_running_loop()
+                pool = _obtener_pool_extraccion()
+                tamaño = -(-num_paginas // MAX_PROCESOS_EXTRACCION)
+                
+                try:
+                    bloques = await asyncio.gather(*(
+                        loop.run_in_executor(pool, _extraer_paginas, archivo_path, inicio, min(inicio + tamaño, num_paginas))
+                        for inicio in range(0, num_paginas, tamaño)
+                    ))
+                    return [texto for bloque in bloques for texto in bloque]
+                except BrokenProcessPool:
+                    # Un proceso terminó de forma abrupta (p. ej. MuPDF falló con
+                    # un PDF malformado): se descarta el pool y este documento se
+                    # extrae en serie
+                    logger.warning("⚠️ Pool de extracción roto, se recrea y se extrae en serie")
+                    _descartar_pool_extraccion(pool)
+        
+        return await asyncio.to_thread(lambda: list(FileService._textos_paginas(contenido)))
+    
+    @staticmethod
+    def _abrir_fitz(origen: Union[str, bytes]):
+        """Abre un PDF con PyMuPDF desde su ruta o desde su contenido en memoria."""
+        if isinstance(origen, bytes):
+            return fitz.open(stream=origen, filetype="pdf")
+        return fitz.open(origen)
+    
+    @staticmethod
+    def _muestra_pdf(origen: Union[str, bytes]) -> Tuple[int, str]:
+        """
+        Abre un PDF (desde su ruta o su contenido) y devuelve su número de
+        páginas y el texto de la primera.
+        
+        Usa PyMuPDF si está instalado y PyPDF2 en caso contrario.
+        """
+        _cargar_motor_pdf()
+        
+        if fitz is not None:
+            with FileService._abrir_fitz(origen) as doc:
+                if doc.page_count == 0:
+                    return 0, ""
+                return doc.page_count, doc.load_page(0).get_text("text")
+        
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(origen) if isinstance(origen, bytes) else origen)
+        num_paginas = len(pdf_reader.pages)
+        if num_paginas == 0:
+            return 0, ""
+        return num_paginas, pdf_reader.pages[0].extract_text()
+    
+    @staticmethod
+    def _textos_paginas(
+        origen: Union[str, bytes],
+        inicio: int = 0,
+        fin: Optional[int] = None
+    ) -> Iterator[Optional[str]]:
+        """
+        Recorre las páginas de un PDF devolviendo el texto de cada una (None
+        si la página no se pudo leer).
+        
+        Usa PyMuPDF si está instalado y PyPDF2 en caso contrario. El rango
+        [inicio, fin) solo se aplica con PyMuPDF.
+        
+        Args:
+            origen: Ruta del PDF o su contenido ya leído en memoria
+            inicio: Primera página a extraer
+            fin: Página siguiente a la última a extraer (por defecto, hasta el final)
+        """
+        _cargar_motor_pdf()
+        
+        if fitz is not None:
+            with FileService._abrir_fitz(origen) as doc:
+                for num_pagina in range(inicio, doc.page_count if fin is None else fin):
+                    try:
+                        yield doc.load_page(num_pagina).get_text("text")
+                    except Exception as e:
+                        logger.warning(f"⚠️ Error extrayendo página {num_pagina + 1}: {str(e)}")
+                        yield None
+            return
+        
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(origen) if isinstance(origen, bytes) else origen)
+        for num_pagina, pagina in enumerate(pdf_reader.pages):
+            try:
+                yield pagina.extract_text()
+            except Exception as e:
+                logger.warning(f"⚠️ Error extrayendo página {num_pagina + 1}: {str(e)}")
+                yield None
+    
     def _limpiar_nombre(self, nombre: str) -> str:
         """Limpia un nombre para usar como nombre de archivo."""
         # Caracteres permitidos: letras, números, guiones y guiones bajos
-        caracteres_validos = ""
-        for char in nombre:
-            if char.isalnum() or char in "-_":
-                caracteres_validos += char
-            elif char.isspace():
-                caracteres_validos += "_"
+        caracteres_validos = PATRON_CARACTERES_NO_VALIDOS.sub("", PATRON_ESPACIOS.sub("_", nombre))
         
         # Limitar longitud
         return caracteres_validos[:50]
     
     def _limpiar_texto(self, texto: str) -> str:
         """Limpia el texto extraído del PDF."""
-        # Eliminar líneas vacías múltiples
-        lineas = texto.split('\n')
-        lineas_limpias = []
-        
-        for linea in lineas:
-            linea_limpia = linea.strip()
-            if linea_limpia:  # Solo agregar líneas no vacías
-                lineas_limpias.append(linea_limpia)
+        # Recortar cada línea y eliminar las líneas vacías. El resultado de
+        # limpiar un prefijo es siempre prefijo del resultado completo: si el
+        # prefijo limpio ya supera el límite, el truncado es el mismo y no hace
+        # falta procesar el resto del texto
+        texto_limpio = None
+        if len(texto) > LONGITUD_PREFIJO_LIMPIEZA:
+            texto_limpio = PATRON_SALTOS_LINEA.sub("\n", texto[:LONGITUD_PREFIJO_LIMPIEZA].strip())
+            if len(texto_limpio) <= LIMITE_TEXTO_ANALISIS:
+                texto_limpio = None
         
-        texto_limpio = '\n'.join(lineas_limpias)
+        if texto_limpio is None:
+            texto_limpio = PATRON_SALTOS_LINEA.sub("\n", texto.strip())
         
         # Limitar texto si es muy largo (para evitar exceder límites de tokens)
-        if len(texto_limpio) > 50000:  # ~50k caracteres
+        if len(texto_limpio) > LIMITE_TEXTO_ANALISIS:
             logger.warning("⚠️ Texto muy largo, truncando para análisis")
-            texto_limpio = texto_limpio[:50000] + "\n\n[... TEXTO TRUNCADO ...]"
+            texto_limpio = texto_limpio[:LIMITE_TEXTO_ANALISIS] + "\n\n[... TEXTO TRUNCADO ...]"
         
         return texto_limpio
     
-    async def crear_archivo_output(
+    def crear_archivo_output(
         self, 
         contenido: str, 
         nombre_archivo: str,
@@ -299,11 +558,11 @@ class FileService:
         """Lista todos los archivos en el directorio input."""
         try:
             archivos = []
-            for archivo in self.input_dir.glob("*.pdf"):
-                stat = archivo.stat()
+            for entrada in self._archivos_directorio(self.input_dir, ".pdf"):
+                stat = entrada.stat()
                 archivos.append({
-                    "nombre": archivo.name,
-                    "path": str(archivo),
+                    "nombre": entrada.name,
+                    "path": entrada.path,
                     "tamaño": stat.st_size,
                     "fecha_modificacion": datetime.fromtimestamp(stat.st_mtime).isoformat()
                 })
@@ -317,16 +576,15 @@ class FileService:
         """Lista todos los archivos en el directorio output."""
         try:
             archivos = []
-            for archivo in self.output_dir.glob("*"):
-                if archivo.is_file():
-                    stat = archivo.stat()
-                    archivos.append({
-                        "nombre": archivo.name,
-                        "path": str(archivo),
-                        "tamaño": stat.st_size,
-                        "extension": archivo.suffix,
-                        "fecha_modificacion": datetime.fromtimestamp(stat.st_mtime).isoformat()
-                    })
+            for entrada in self._archivos_directorio(self.output_dir):
+                stat = entrada.stat()
+                archivos.append({
+                    "nombre": entrada.name,
+                    "path": entrada.path,
+                    "tamaño": stat.st_size,
+                    "extension": os.path.splitext(entrada.name)[1],
+                    "fecha_modificacion": datetime.fromtimestamp(stat.st_mtime).isoformat()
+                })
             
             return archivos
         except Exception as e:
@@ -377,21 +635,60 @@ class FileService:
         """
         try:
             stats = {
-                "input_dir": {
-                    "archivos": len(list(self.input_dir.glob("*.pdf"))),
-                    "tamaño_total": sum(f.stat().st_size for f in self.input_dir.glob("*.pdf"))
-                },
-                "output_dir": {
-                    "archivos": len(list(self.output_dir.glob("*"))),
-                    "tamaño_total": sum(f.stat().st_size for f in self.output_dir.glob("*") if f.is_file())
-                },
-                "logs_dir": {
-                    "archivos": len(list(self.logs_dir.glob("*"))),
-                    "tamaño_total": sum(f.stat().st_size for f in self.logs_dir.glob("*") if f.is_file())
-                }
+                "input_dir": self._estadisticas_directorio(self.input_dir, ".pdf"),
+                "output_dir": self._estadisticas_directorio(self.output_dir),
+                "logs_dir": self._estadisticas_directorio(self.logs_dir)
             }
             
             return stats
         except Exception as e:
             logger.error(f"❌ Error obteniendo estadísticas: {str(e)}")
-            return {}
\ No newline at end of file
+            return {}
+    
+    @staticmethod
+    def _archivos_directorio(directorio: Path, sufijo: str = "") -> Iterator[os.DirEntry]:
+        """
+        Recorre los archivos de un directorio con os.scandir, que obtiene el
+        tipo de cada entrada al leer el directorio sin una llamada a stat.
+        
+        Igual que glob("*"), se omiten los archivos ocultos; un directorio
+        inexistente se trata como vacío.
+        
+        Args:
+            directorio: Directorio a recorrer
+            sufijo: Sufijo que deben tener los archivos (opcional)
+        """
+        try:
+            with os.scandir(directorio) as entradas:
+                for entrada in entradas:
+                    if entrada.name.startswith(".") or not entrada.name.endswith(sufijo):
+                        continue
+                    if entrada.is_file():
+                        yield entrada
+        except FileNotFoundError:
+            return
+    
+    @staticmethod
+    def _estadisticas_directorio(directorio: Path, sufijo: str = "") -> Dict:
+        """
+        Cuenta los archivos de un directorio y su tamaño total en una sola
+        pasada.
+        
+        Args:
+            directorio: Directorio a recorrer
+            sufijo: Sufijo que deben tener los archivos (opcional)
+            
+        Returns:
+            Dict con número de archivos y tamaño total
+        """
+        archivos = 0
+        tamaño_total = 0
+        
+        for entrada in FileService._archivos_directorio(directorio, sufijo):
+            archivos += 1
+            tamaño_total += entrada.stat().st_size
+        
+        return {
+            "archivos": archivos,
+            "tamaño_total": tamaño_total
+        }
@@ -4,14 +4,29 @@ Maneja las comunicaciones con los modelos de IA.
 """
 
 import asyncio
-import json
-from typing import Dict, Optional, List
+import time
+from typing import AsyncIterator, Dict, Optional, List, Tuple
+import httpx
 import openai
 from openai import AsyncOpenAI
 
 from config.settings import settings
+from utils.serializacion import cargar_json, volcar_json, JSONDecodeError
 from loguru import logger
 
+try:
+    import h2  # Requerido por httpx para HTTP/2
+    HTTP2_DISPONIBLE = True
+except ImportError:
+    HTTP2_DISPONIBLE = False
+
+# Límites del pool de conexiones compartido por todas las instancias
+OPENAI_HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+OPENAI_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+# Tiempo durante el que se reutiliza una validación de conexión exitosa
+TTL_VALIDACION_SEGUNDOS = 300
+
 class OpenAIService:
     """
     Servicio para interactuar con la API de OpenAI.
@@ -20,6 +35,89 @@ class OpenAIService:
     y configuraciones según el agente que lo utilice.
     """
     
+    # Cliente HTTP compartido: las peticiones concurrentes de todos los agentes
+    # reutilizan las mismas conexiones TLS (multiplexadas si hay HTTP/2)
+    _http_client: Optional[httpx.AsyncClient] = None
+    
+    @classmethod
+    def _obtener_http_client(cls) -> httpx.AsyncClient:
+        """Devuelve el cliente HTTP compartido, creándolo la primera vez."""
+        if cls._http_client is None:
+            cls._http_client = httpx.AsyncClient(
+                http2=HTTP2_DISPONIBLE,
+                limits=OPENAI_HTTP_LIMITS,
+                timeout=OPENAI_HTTP_TIMEOUT
+            )
+            logger.debug(f"🌐 Cliente HTTP de OpenAI creado (HTTP/2: {HTTP2_DISPONIBLE})")
+        
+        return cls._http_client
+    
+    # Clientes de OpenAI compartidos, uno por clave API
+    _clientes: Dict[str, AsyncOpenAI] = {}
+    
+    @classmethod
+    def _obtener_cliente(cls, api_key: str) -> AsyncOpenAI:
+        """Devuelve el cliente de OpenAI de la clave API, creándolo la primera vez."""
+        if api_key not in cls._clientes:
+            # El SDK reintenta los errores transitorios (429, 5xx, conexión y
+            # timeout) con espera exponencial y jitter; los 400 no se reintentan
+            cls._clientes[api_key] = AsyncOpenAI(
+                api_key=api_key,
+                http_client=cls._obtener_http_client(),
+                max_retries=settings.OPENAI_MAX_RETRIES
+            )
+        
+        return cls._clientes[api_key]
+    
+    # Limita las peticiones simultáneas a OpenAI de todo el proceso, de modo
+    # que las llamadas lanzadas en paralelo (varias sesiones, categorías
+    # pendientes, lotes) no disparen los límites de rate de la API
+    _semaforo: Optional[asyncio.Semaphore] = None
+    
+    @classmethod
+    def _obtener_semaforo(cls) -> asyncio.Semaphore:
+        """Devuelve el semáforo de peticiones concurrentes, creándolo la primera vez."""
+        if cls._semaforo is None:
+            cls._semaforo = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+        
+        return cls._semaforo
+    
+    @classmethod
+    async def precalentar_conexiones(cls, api_keys: List[str]) -> None:
+        """
+        Abre por adelantado las conexiones con OpenAI (DNS + TLS) con una
+        petición barata por clave, para que la primera evaluación no pague
+        ese coste.
+        
+        Args:
+            api_keys: Claves API que usarán los agentes
+        """
+        claves = [api_key for api_key in dict.fromkeys(api_keys) if api_key]
+        
+        resultados = await asyncio.gather(
+            *(
+                cls._obtener_cliente(api_key).with_options(max_retries=0, timeout=5.0).models.list()
+                for api_key in claves
+            ),
+            return_exceptions=True
+        )
+        
+        fallos = sum(isinstance(resultado, Exception) for resultado in resultados)
+        if fallos:
+            logger.warning(f"⚠️ No se pudieron precalentar {fallos} conexiones con OpenAI")
+        else:
+            logger.debug(f"🌐 Conexiones con OpenAI precalentadas ({len(claves)} claves)")
+    
+    @classmethod
+    async def cerrar_conexiones(cls) -> None:
+        """Cierra el pool de conexiones compartido (al detener el sistema)."""
+        if cls._http_client is not None:
+            await cls._http_client.aclose()
+            cls._http_client = None
+            cls._clientes.clear()
+            cls._semaforo = None
+            logger.debug("🌐 Cliente HTTP de OpenAI cerrado")
+    
     def __init__(self, api_key: str):
         """
         Inicializa el servicio de OpenAI.
@@ -28,20 +126,32 @@ class OpenAIService:
             api_key: Clave API de OpenAI
         """
         self.api_key = api_key
-        self.client = AsyncOpenAI(api_key=api_key)
+        self.client = self._obtener_cliente(api_key)
         self.model = settings.OPENAI_MODEL
         self.max_tokens = settings.MAX_TOKENS
         self.temperature = settings.TEMPERATURE
         
         logger.info("🤖 Servicio OpenAI inicializado")
     
+    @staticmethod
+    def _construir_mensajes(prompt: str, system_message: Optional[str]) -> List[Dict]:
+        """Construye la lista de mensajes de una petición (sistema opcional + usuario)."""
+        if system_message:
+            return [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ]
+        
+        return [{"role": "user", "content": prompt}]
+    
     async def generar_respuesta(
         self, 
         prompt: str, 
         system_message: Optional[str] = None,
         model: Optional[str] = None,
         max_tokens: Optional[int] = None,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        response_format: Optional[Dict] = None
     ) -> str:
         """
         Genera una respuesta usando OpenAI.
@@ -52,6 +162,7 @@ class OpenAIService:
             model: Modelo específico a usar (opcional)
             max_tokens: Número máximo de tokens (opcional)
             temperature: Temperatura para la generación (opcional)
+            response_format: Formato de respuesta, p. ej. {"type": "json_object"} (opcional)
             
         Returns:
             Respuesta generada por el modelo
@@ -66,31 +177,23 @@ class OpenAIService:
             temperature_to_use = temperature or self.temperature
             
             # Preparar mensajes
-            messages = []
-            
-            if system_message:
-                messages.append({
-                    "role": "system",
-                    "content": system_message
-                })
-            
-            messages.append({
-                "role": "user",
-                "content": prompt
-            })
+            messages = self._construir_mensajes(prompt, system_message)
             
             logger.debug(f"📤 Enviando petición a OpenAI - Modelo: {model_to_use}")
             
+            parametros_extra = {}
+            if response_format:
+                parametros_extra["response_format"] = response_format
+            
             # Realizar petición a OpenAI
-            response = await self.client.chat.completions.create(
-                model=model_to_use,
-                messages=messages,
-                max_tokens=max_tokens_to_use,
-                temperature=temperature_to_use,
-                top_p=1,
-                frequency_penalty=0,
-                presence_penalty=0
-            )
+            async with self._obtener_semaforo():
+                response = await self.client.chat.completions.create(
+                    model=model_to_use,
+                    messages=messages,
+                    max_tokens=max_tokens_to_use,
+                    temperature=temperature_to_use,
+                    **parametros_extra
+                )
             
             # Extraer respuesta
             if response.choices and len(response.choices) > 0:
@@ -118,11 +221,36 @@ class OpenAIService:
             logger.error(f"❌ Error inesperado en OpenAI: {str(e)}")
             raise Exception(f"Error en comunicación con OpenAI: {str(e)}")
     
+    async def generar_respuestas_lote(
+        self,
+        peticiones: List[Tuple[str, Optional[str]]],
+        **kwargs
+    ) -> List[str]:
+        """
+        Genera en paralelo las respuestas de varios prompts independientes.
+        
+        Las peticiones se lanzan a la vez y el semáforo compartido limita
+        cuántas están en curso (OPENAI_MAX_CONCURRENCY); los 429 los reintenta
+        el SDK con espera exponencial.
+        
+        Args:
+            peticiones: Lista de pares (prompt, system_message)
+            **kwargs: Parámetros adicionales de generar_respuesta
+            
+        Returns:
+            Respuestas en el mismo orden que las peticiones
+        """
+        return list(await asyncio.gather(*(
+            self.generar_respuesta(prompt, system_message, **kwargs)
+            for prompt, system_message in peticiones
+        )))
+    
     async def generar_respuesta_json(
         self,
         prompt: str,
         system_message: Optional[str] = None,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        forzar_objeto: bool = False
     ) -> str:
         """
         Genera una respuesta en formato JSON usando OpenAI.
@@ -132,6 +260,8 @@ class OpenAIService:
             prompt: Mensaje principal para el modelo
             system_message: Mensaje de sistema (opcional)
             model: Modelo específico a usar (opcional)
+            forzar_objeto: Usa el modo JSON de OpenAI, que garantiza un objeto
+                JSON parseable (no admite listas como raíz)
             
         Returns:
             Respuesta en formato JSON como string
@@ -149,12 +279,14 @@ Asegúrate de que todas las comillas estén correctamente escapadas."""
             if not system_message:
                 system_message = "Eres un analista financiero experto. Siempre respondes en formato JSON válido, sin texto adicional ni markdown."
             
-            # Generar respuesta
-            response = await self.generar_respuesta(
+            # Generar respuesta en streaming: el cuerpo se recibe a medida que
+            # el modelo lo genera y se decodifica una sola vez al completarse
+            response = await self.generar_respuesta_streaming(
                 prompt=json_prompt,
                 system_message=system_message,
                 model=model,
-                temperature=0.3  # Temperatura baja para respuestas más consistentes
+                temperature=0.3,  # Temperatura baja para respuestas más consistentes
+                response_format={"type": "json_object"} if forzar_objeto else None
             )
             
             # Limpiar respuesta de posibles marcadores de markdown
@@ -173,17 +305,17 @@ Asegúrate de que todas las comillas estén correctamente escapadas."""
             
             # Validar que sea JSON válido
             try:
-                json.loads(cleaned_response)
+                cargar_json(cleaned_response)
                 return cleaned_response
-            except json.JSONDecodeError as e:
+            except JSONDecodeError as e:
                 logger.error(f"❌ Respuesta no es JSON válido: {e}")
-                logger.debug(f"Respuesta recibida: {cleaned_response[:500]}")
+                logger.opt(lazy=True).debug("Respuesta recibida: {}", lambda: cleaned_response[:500])
                 # Devolver un JSON de error válido
-                error_json = json.dumps({
+                error_json = volcar_json({
                     "error": "Respuesta inválida del modelo",
                     "detalle": str(e),
                     "respuesta_original": cleaned_response[:200]
-                })
+                }).decode("utf-8")
                 return error_json
                 
                 # Intentar extraer JSON de la respuesta
@@ -192,30 +324,78 @@ Asegúrate de que todas las comillas estén correctamente escapadas."""
                 if json_match:
                     potential_json = json_match.group(0)
                     try:
-                        json.loads(potential_json)
+                        cargar_json(potential_json)
                         logger.info("✅ JSON extraído exitosamente de la respuesta")
                         return potential_json
                     except:
                         pass
                 
                 # Si todo falla, retornar un JSON de error
-                return json.dumps({
+                return volcar_json({
                     "error": "No se pudo generar respuesta en formato JSON",
                     "raw_response": cleaned_response[:200]
-                })
+                }).decode("utf-8")
                 
         except Exception as e:
             logger.error(f"❌ Error generando respuesta JSON: {str(e)}")
-            return json.dumps({
+            return volcar_json({
                 "error": str(e),
                 "tipo_error": "generation_error"
-            })
+            }).decode("utf-8")
+    
+    async def stream_respuesta(
+        self,
+        prompt: str,
+        system_message: Optional[str] = None,
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        response_format: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """
+        Genera una respuesta en streaming entregando los fragmentos a medida
+        que el modelo los produce.
+        
+        Args:
+            prompt: Mensaje principal
+            system_message: Mensaje de sistema (opcional)
+            model: Modelo específico a usar (opcional)
+            temperature: Temperatura para la generación (opcional)
+            response_format: Formato de respuesta, p. ej. {"type": "json_object"} (opcional)
+            
+        Yields:
+            Fragmentos de texto de la respuesta
+        """
+        messages = self._construir_mensajes(prompt, system_message)
+        
+        logger.debug("📤 Iniciando streaming de OpenAI")
+        
+        parametros_extra = {}
+        if response_format:
+            parametros_extra["response_format"] = response_format
+        
+        # El semáforo se mantiene hasta terminar de recibir el stream
+        async with self._obtener_semaforo():
+            stream = await self.client.chat.completions.create(
+                model=model or self.model,
+                messages=messages,
+                max_tokens=self.max_tokens,
+                temperature=temperature if temperature is not None else self.temperature,
+                stream=True,
+                **parametros_extra
+            )
+            
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    yield chunk.choices[0].delta.content
     
     async def generar_respuesta_streaming(
         self, 
         prompt: str, 
         system_message: Optional[str] = None,
-        callback = None
+        callback = None,
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        response_format: Optional[Dict] = None
     ) -> str:
         """
         Genera una respuesta en modo streaming (para respuestas largas).
@@ -224,44 +404,31 @@ Asegúrate de que todas las comillas estén correctamente escapadas."""
             prompt: Mensaje principal
             system_message: Mensaje de sistema (opcional)
             callback: Función callback para procesar chunks (opcional)
+            model: Modelo específico a usar (opcional)
+            temperature: Temperatura para la generación (opcional)
+            response_format: Formato de respuesta, p. ej. {"type": "json_object"} (opcional)
             
         Returns:
             Respuesta completa generada
         """
         try:
-            messages = []
-            
-            if system_message:
-                messages.append({
-                    "role": "system",
-                    "content": system_message
-                })
+            # Los fragmentos se acumulan en una lista y se unen al final
+            fragmentos = []
             
-            messages.append({
-                "role": "user",
-                "content": prompt
-            })
-            
-            logger.debug("📤 Iniciando streaming de OpenAI")
-            
-            full_response = ""
-            
-            stream = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                stream=True
-            )
+            async for content_chunk in self.stream_respuesta(
+                prompt,
+                system_message=system_message,
+                model=model,
+                temperature=temperature,
+                response_format=response_format
+            ):
+                fragmentos.append(content_chunk)
+                
+                # Llamar callback si está disponible
+                if callback:
+                    await callback(content_chunk)
             
-            async for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    content_chunk = chunk.choices[0].delta.content
-                    full_response += content_chunk
-                    
-                    # Llamar callback si está disponible
-                    if callback:
-                        await callback(content_chunk)
+            full_response = "".join(fragmentos)
             
             logger.debug(f"📥 Streaming completado ({len(full_response)} caracteres)")
             
@@ -328,13 +495,25 @@ Asegúrate de que todas las comillas estén correctamente escapadas."""
             temperature=0.1  # Menos creatividad para análisis financieros
         )
     
+    # Validaciones exitosas recientes: (api_key, modelo) -> (instante, resultado)
+    _validaciones: Dict[Tuple[str, str], Tuple[float, Dict]] = {}
+    
     async def validar_conexion(self) -> Dict:
         """
         Valida que la conexión con OpenAI esté funcionando.
         
+        Una validación exitosa se reutiliza durante TTL_VALIDACION_SEGUNDOS
+        para la misma clave y modelo; los fallos no se guardan, de modo que
+        el siguiente intento vuelve a consultar la API.
+        
         Returns:
             Dict con resultado de la validación
         """
+        clave = (self.api_key, self.model)
+        validacion = self._validaciones.get(clave)
+        if validacion is not None and time.monotonic() - validacion[0] < TTL_VALIDACION_SEGUNDOS:
+            return dict(validacion[1])
+        
         try:
             # Hacer una petición simple de prueba
             test_response = await self.generar_respuesta(
@@ -344,11 +523,13 @@ Asegúrate de que todas las comillas estén correctamente escapadas."""
             
             if "OK" in test_response:
                 logger.info("✅ Conexión con OpenAI validada correctamente")
-                return {
+                resultado = {
                     "valid": True,
                     "message": "Conexión exitosa",
                     "model": self.model
                 }
+                self._validaciones[clave] = (time.monotonic(), resultado)
+                return dict(resultado)
             else:
                 return {
                     "valid": False,
@@ -30,15 +30,25 @@ class TelegramService:
     - Gestión de sesiones de usuarios
     """
     
-    def __init__(self):
-        """Inicializa el servicio de Telegram."""
+    def __init__(
+        self,
+        secretaria: Optional[SecretariaVirtual] = None,
+        analista: Optional[AnalistaRiesgos] = None
+    ):
+        """
+        Inicializa el servicio de Telegram.
+        
+        Args:
+            secretaria: Secretaria Virtual ya creada por el sistema (opcional)
+            analista: Analista de Riesgos ya creado por el sistema (opcional)
+        """
         self.bot_token = settings.TELEGRAM_BOT_TOKEN
         self.bot = Bot(token=self.bot_token)
         self.application = Application.builder().token(self.bot_token).build()
         
-        # Agentes
-        self.secretaria = SecretariaVirtual()
-        self.analista = AnalistaRiesgos()
+        # Agentes (compartidos con el sistema si se reciben)
+        self.secretaria = secretaria or SecretariaVirtual()
+        self.analista = analista or AnalistaRiesgos()
         
         # Estados de usuario
         self.user_sessions = {}
@@ -383,8 +393,12 @@ Usa /cancelar para reiniciar el proceso.
             temp_dir = tempfile.gettempdir()
             archivo_temp = os.path.join(temp_dir, f"{user_id}_{update.message.document.file_name}")
             
+            # Se descarga a memoria y se escribe con aiofiles: download_to_drive
+            # escribe el archivo de forma bloqueante dentro del event loop
             logger.info(f"📥 Descargando PDF a: {archivo_temp}")
-            await file.download_to_drive(archivo_temp)
+            contenido_pdf = await file.download_as_bytearray()
+            async with aiofiles.open(archivo_temp, 'wb') as f:
+                await f.write(contenido_pdf)
             
             # Procesar con la Secretaria Virtual
             session_id = session["session_id"]
@@ -416,9 +430,10 @@ Usa /cancelar para reiniciar el proceso.
             finally:
                 # Limpiar archivo temporal
                 try:
-                    if os.path.exists(archivo_temp):
-                        os.remove(archivo_temp)
-                        logger.info(f"🗑️ Archivo temporal eliminado: {archivo_temp}")
+                    await asyncio.to_thread(os.remove, archivo_temp)
+                    logger.info(f"🗑️ Archivo temporal eliminado: {archivo_temp}")
+                except FileNotFoundError:
+                    pass
                 except Exception as e:
                     logger.warning(f"⚠️ No se pudo eliminar archivo temporal: {e}")
             
@@ -517,15 +532,19 @@ Usa /cancelar para reiniciar el proceso.
                 parse_mode=ParseMode.HTML
             )
             
-            # Enviar archivo PDF
-            if Path(pdf_path).exists():
-                with open(pdf_path, 'rb') as pdf_file:
-                    await update.message.reply_document(
-                        document=pdf_file,
-                        filename=f"Reporte_Financiero_{empresa.replace(' ', '_')}.pdf",
-                        caption="📊 <b>Reporte Financiero Completo</b>\n\n✅ Análisis realizado por YaTeApruebo",
-                        parse_mode=ParseMode.HTML
-                    )
+            # Enviar archivo PDF (leído en un hilo para no bloquear el event loop)
+            try:
+                pdf_bytes = await asyncio.to_thread(Path(pdf_path).read_bytes)
+            except FileNotFoundError:
+                pdf_bytes = None
+            
+            if pdf_bytes is not None:
+                await update.message.reply_document(
+                    document=pdf_bytes,
+                    filename=f"Reporte_Financiero_{empresa.replace(' ', '_')}.pdf",
+                    caption="📊 <b>Reporte Financiero Completo</b>\n\n✅ Análisis realizado por YaTeApruebo",
+                    parse_mode=ParseMode.HTML
+                )
             
             # Actualizar estado final
             self.user_sessions[user_id]["estado"] = "completado"
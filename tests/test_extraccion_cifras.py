@@ -0,0 +1,70 @@
+"""
+Pruebas de la extracción de cifras del estado financiero (Analista de Riesgos).
+"""
+
+import unittest
+
+from agents.analista_riesgos import AnalistaRiesgos
+
+ESTADO_FINANCIERO = """
+ESTADO DE SITUACIÓN FINANCIERA
+Activos corrientes 2023 2022
+Efectivo y equivalentes 120,000 95,000
+Cuentas por cobrar 250,000 210,000
+Inventarios 300,000 280,000
+Total activos corrientes 670,000 585,000
+Propiedad, planta y equipo 830,000 800,000
+Total activos no corrientes 830,000 800,000
+Total activos 1,500,000 1,385,000
+Pasivos corrientes 2023 2022
+Cuentas por pagar 180,000 150,000
+Total pasivos corrientes 400,000 350,000
+Total pasivos no corrientes 350,000 380,000
+Total pasivos 750,000 730,000
+Total patrimonio 750,000 655,000
+Total pasivos y patrimonio 1,500,000 1,385,000
+
+ESTADO DE RESULTADOS
+Ingresos financieros 5,000 4,000
+Ingresos operacionales 2,000,000 1,800,000
+Costo de ventas (1,200,000) (1,100,000)
+Utilidad bruta 800,000 700,000
+Utilidad operacional 300,000 250,000
+Gastos financieros 40,000 45,000
+Utilidad neta 180,000 140,000
+"""
+
+class TestExtraccionCifras(unittest.TestCase):
+    
+    def setUp(self):
+        # Solo se usan los métodos de extracción, que no dependen de OpenAI
+        self.analista = AnalistaRiesgos.__new__(AnalistaRiesgos)
+    
+    def test_extrae_cifras_de_un_estado_financiero(self):
+        hechos = self.analista._extraer_hechos_numericos(ESTADO_FINANCIERO)
+        
+        self.assertEqual(hechos["activo_corriente"], 670000)
+        self.assertEqual(hechos["activo_total"], 1500000)
+        self.assertEqual(hechos["pasivo_corriente"], 400000)
+        self.assertEqual(hechos["pasivo_total"], 750000)
+        self.assertEqual(hechos["patrimonio"], 750000)
+        self.assertEqual(hechos["ventas"], 2000000)
+        self.assertEqual(hechos["costo_ventas"], -1200000)
+        self.assertEqual(hechos["utilidad_neta"], 180000)
+    
+    def test_convertir_numero(self):
+        casos = [
+            ("1,500,000", 1500000.0),
+            ("1.500.000,50", 1500000.5),
+            ("(300)", -300.0),
+            ("0,123", 0.123),
+            ("1,5.", 1.5),
+            ("670,000.", 670000.0)
+        ]
+        
+        for texto, esperado in casos:
+            with self.subTest(texto=texto):
+                self.assertAlmostEqual(AnalistaRiesgos._convertir_numero(texto), esperado)
+
+if __name__ == "__main__":
+    unittest.main()
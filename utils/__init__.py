@@ -1,7 +1,19 @@
 """Utilidades del sistema YaTeApruebo."""
 
-from .validators import DataValidator
-from .pdf_processor import PDFProcessor
-from .report_generator import ReportGenerator
+import importlib
 
-__all__ = ["DataValidator", "PDFProcessor", "ReportGenerator"]
\ No newline at end of file
+# Las utilidades se importan al primer acceso (PEP 562): importar un
+# submódulo concreto (p. ej. utils.serializacion) no carga reportlab ni PyPDF2
+_MODULOS = {
+    "DataValidator": "validators",
+    "PDFProcessor": "pdf_processor",
+    "ReportGenerator": "report_generator"
+}
+
+__all__ = ["DataValidator", "PDFProcessor", "ReportGenerator"]
+
+def __getattr__(nombre):
+    """Importa el submódulo de la clase pedida la primera vez que se usa."""
+    if nombre in _MODULOS:
+        return getattr(importlib.import_module(f".{_MODULOS[nombre]}", __name__), nombre)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
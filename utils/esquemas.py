@@ -0,0 +1,72 @@
+"""
+Esquemas de las respuestas JSON del modelo.
+Validan con msgspec la estructura de la respuesta antes de usarla.
+"""
+
+from typing import Any, List, Literal, Union
+import msgspec
+
+# Excepción lanzada cuando la respuesta no cumple el esquema
+ValidationError = msgspec.ValidationError
+
+class Calificacion(msgspec.Struct):
+    """Calificación de riesgo global."""
+    nivel: Literal["BASICO", "INTERMEDIO", "AVANZADO"]
+    puntuacion: Union[int, float]
+    factores: List[str] = msgspec.field(default_factory=list)
+    justificacion: str = ""
+
+class Recomendaciones(msgspec.Struct):
+    """Recomendaciones accionables del análisis."""
+    recomendaciones: List[str]
+
+class _EmpresaIndice(msgspec.Struct):
+    nombre: Any = None
+    sector: Any = None
+
+class _CalificacionIndice(msgspec.Struct):
+    nivel: Any = None
+    puntuacion: Any = None
+
+class EvaluacionIndice(msgspec.Struct):
+    """Campos de un análisis completo que usa el índice de evaluaciones."""
+    session_id: Any = None
+    fecha_analisis: Any = None
+    empresa: _EmpresaIndice = msgspec.field(default_factory=_EmpresaIndice)
+    calificacion_riesgo: _CalificacionIndice = msgspec.field(default_factory=_CalificacionIndice)
+
+def decodificar_parcial(contenido: bytes, esquema: Any) -> Any:
+    """
+    Decodifica de un documento JSON solo los campos declarados en el esquema.
+    
+    msgspec recorre el resto del documento sin crear objetos de Python, por lo
+    que extraer unos pocos campos de un análisis grande es mucho más barato
+    que decodificarlo completo.
+    
+    Args:
+        contenido: JSON en bytes
+        esquema: Struct con los campos a extraer
+    
+    Returns:
+        Campos extraídos como tipos básicos (dict, list...)
+    
+    Raises:
+        ValidationError: Si los campos no tienen la forma esperada
+    """
+    return msgspec.to_builtins(msgspec.json.decode(contenido, type=esquema))
+
+def validar(contenido: Any, esquema: Any) -> Any:
+    """
+    Valida un JSON ya decodificado contra un esquema.
+    
+    Args:
+        contenido: JSON decodificado
+        esquema: Struct o tipo esperado (Calificacion, Recomendaciones...)
+    
+    Returns:
+        Contenido validado convertido a tipos básicos (dict, list...)
+    
+    Raises:
+        ValidationError: Si el contenido no cumple el esquema
+    """
+    return msgspec.to_builtins(msgspec.convert(contenido, type=esquema, strict=False))
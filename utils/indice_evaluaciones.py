@@ -0,0 +1,235 @@
+"""
+Índice de evaluaciones realizadas.
+Guarda un registro compacto por evaluación en un archivo JSON Lines para
+listarlas sin abrir cada análisis completo.
+"""
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: sin bloqueo entre procesos
+
+from utils.serializacion import cargar_json, contenido_json_archivo, volcar_json, SUFIJO_COMPRIMIDO
+from utils.esquemas import EvaluacionIndice, ValidationError, decodificar_parcial
+from loguru import logger
+
+NOMBRE_INDICE = "evaluaciones_index.jsonl"
+SUFIJOS_ANALISIS = ("_analisis_completo.json", "_analisis_completo.json" + SUFIJO_COMPRIMIDO)
+
+# Registros ya leídos de cada índice, junto con la (fecha de modificación,
+# tamaño) del archivo en ese momento; se vuelven a leer solo si el archivo cambia
+_registros_en_memoria: Dict[Path, Tuple[Tuple[int, int], List[Dict]]] = {}
+
+def registro_evaluacion(analisis: Dict) -> Dict:
+    """
+    Construye el registro del índice a partir de un análisis completo.
+    
+    Args:
+        analisis: Reporte final del análisis
+    
+    Returns:
+        Dict con session_id, empresa, sector, fecha, calificación y puntuación
+    """
+    empresa = analisis.get("empresa", {})
+    calificacion = analisis.get("calificacion_riesgo", {})
+    
+    return {
+        "session_id": analisis.get("session_id"),
+        "empresa": empresa.get("nombre"),
+        "sector": empresa.get("sector"),
+        "fecha_analisis": analisis.get("fecha_analisis"),
+        "calificacion_riesgo": calificacion.get("nivel"),
+        "puntuacion": calificacion.get("puntuacion")
+    }
+
+def _escribir(ruta: Path, registros: List[Dict], agregar: bool) -> None:
+    """Escribe registros en el índice (agregando al final o reemplazándolo)."""
+    lineas = [volcar_json(registro) + b"\n" for registro in registros]
+    
+    if agregar:
+        with open(ruta, "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.writelines(lineas)
+        return
+    
+    temporal = ruta.with_suffix(f".{os.getpid()}.tmp")
+    with open(temporal, "wb") as f:
+        f.writelines(lineas)
+    os.replace(temporal, ruta)
+
+async def registrar_evaluacion(directorio: Union[str, Path], analisis: Dict) -> None:
+    """
+    Agrega una evaluación al índice.
+    
+    Si el índice aún no existe se reconstruye primero a partir de los
+    análisis guardados; de lo contrario el primer registro crearía un índice
+    con una sola evaluación y las anteriores no se listarían nunca.
+    
+    Args:
+        directorio: Directorio de salida donde vive el índice
+        analisis: Reporte final del análisis
+    """
+    try:
+        ruta = Path(directorio) / NOMBRE_INDICE
+        registro = registro_evaluacion(analisis)
+        
+        if not await asyncio.to_thread(ruta.exists):
+            registros = await reconstruir_indice(directorio)
+            # El análisis ya se guardó antes de registrarlo, así que
+            # normalmente forma parte del índice reconstruido
+            if any(r.get("session_id") == registro["session_id"] for r in registros):
+                return
+        
+        await asyncio.to_thread(_escribir, ruta, [registro], True)
+    except Exception as e:
+        logger.warning(f"⚠️ Error actualizando índice de evaluaciones: {str(e)}")
+
+def _registro_desde_archivo(archivo: Path) -> Dict:
+    """Lee de un análisis completo solo los campos que necesita el índice."""
+    with open(archivo, "rb") as f:
+        contenido = contenido_json_archivo(f.read(), archivo)
+    
+    try:
+        return registro_evaluacion(decodificar_parcial(contenido, EvaluacionIndice))
+    except ValidationError:
+        # Forma inesperada (p. ej. un análisis antiguo): decodificación completa
+        return registro_evaluacion(cargar_json(contenido))
+
+def _recorrer_analisis(directorio: Path) -> List[Dict]:
+    """Construye los registros de todos los análisis del directorio (en un hilo)."""
+    registros = []
+    
+    # scandir da el tipo de cada entrada sin un stat adicional por archivo
+    try:
+        with os.scandir(directorio) as entradas:
+            archivos = [
+                Path(entrada.path) for entrada in entradas
+                if entrada.name.endswith(SUFIJOS_ANALISIS) and entrada.is_file(follow_symlinks=False)
+            ]
+    except FileNotFoundError:
+        return registros
+    
+    for archivo in archivos:
+        try:
+            registros.append(_registro_desde_archivo(archivo))
+        except Exception:
+            continue  # Saltar archivos corruptos
+    
+    return registros
+
+async def reconstruir_indice(directorio: Union[str, Path]) -> List[Dict]:
+    """
+    Reconstruye el índice leyendo todos los análisis completos.
+    
+    Args:
+        directorio: Directorio de salida
+    
+    Returns:
+        Lista de registros del índice, ordenada por fecha descendente
+    """
+    directorio = Path(directorio)
+    registros = await asyncio.to_thread(_recorrer_analisis, directorio)
+    
+    await asyncio.to_thread(_escribir, directorio / NOMBRE_INDICE, registros, False)
+    logger.info(f"🗂️ Índice de evaluaciones reconstruido ({len(registros)} evaluaciones)")
+    
+    return _ordenar_por_fecha(registros)
+
+def _ordenar_por_fecha(registros: Iterable[Dict]) -> List[Dict]:
+    """Ordena registros del índice de la evaluación más reciente a la más antigua."""
+    return sorted(registros, key=lambda registro: registro.get("fecha_analisis") or "", reverse=True)
+
+def cargar_indice(directorio: Union[str, Path]) -> Optional[List[Dict]]:
+    """
+    Carga el índice de evaluaciones, ordenado de la evaluación más reciente a
+    la más antigua (sin reconstruirlo; para uso síncrono o desde un hilo).
+    
+    Si una evaluación se registró varias veces se conserva el último registro;
+    un registro marcado como "eliminado" la quita del resultado.
+    Los registros se mantienen en memoria y solo se vuelve a leer el archivo
+    cuando cambia su fecha de modificación o su tamaño (por esta instancia o
+    por otro proceso).
+    
+    Args:
+        directorio: Directorio de salida
+    
+    Returns:
+        Lista de registros ordenada por fecha descendente, o None si el
+        índice no existe
+    """
+    ruta = Path(directorio) / NOMBRE_INDICE
+    
+    try:
+        estado = ruta.stat()
+        version = (estado.st_mtime_ns, estado.st_size)
+        
+        en_memoria = _registros_en_memoria.get(ruta)
+        if en_memoria is not None and en_memoria[0] == version:
+            return list(en_memoria[1])
+        
+        with open(ruta, "rb") as f:
+            lineas = f.readlines()
+    except FileNotFoundError:
+        return None
+    
+    registros = {}
+    
+    for linea in lineas:
+        try:
+            registro = cargar_json(linea)
+            if registro.get("eliminado"):
+                registros.pop(registro["session_id"], None)
+            else:
+                registros[registro["session_id"]] = registro
+        except Exception:
+            continue  # Saltar líneas incompletas
+    
+    # Se ordena una sola vez por versión del archivo, no en cada consulta
+    ordenados = _ordenar_por_fecha(registros.values())
+    _registros_en_memoria[ruta] = (version, ordenados)
+    
+    return list(ordenados)
+
+async def leer_indice(directorio: Union[str, Path]) -> List[Dict]:
+    """
+    Lee el índice de evaluaciones (reconstruyéndolo si no existe), ordenado
+    de la evaluación más reciente a la más antigua.
+    
+    Args:
+        directorio: Directorio de salida
+    
+    Returns:
+        Lista de registros del índice, ordenada por fecha descendente
+    """
+    registros = await asyncio.to_thread(cargar_indice, directorio)
+    
+    if registros is None:
+        return await reconstruir_indice(directorio)
+    
+    return registros
+
+async def eliminar_del_indice(directorio: Union[str, Path], session_id: str) -> None:
+    """
+    Elimina una evaluación del índice.
+    
+    En lugar de reescribir el archivo (lo que podría perder un registro
+    agregado por otro proceso entre la lectura y el reemplazo) se agrega,
+    con el mismo bloqueo que los registros normales, una marca de eliminación
+    que cargar_indice aplica al leer. Las marcas desaparecen la próxima vez
+    que el índice se reconstruye.
+    
+    Args:
+        directorio: Directorio de salida
+        session_id: ID de la sesión eliminada
+    """
+    try:
+        marca = {"session_id": session_id, "eliminado": True}
+        await asyncio.to_thread(_escribir, Path(directorio) / NOMBRE_INDICE, [marca], True)
+    except Exception as e:
+        logger.warning(f"⚠️ Error actualizando índice de evaluaciones: {str(e)}")
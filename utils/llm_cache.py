@@ -0,0 +1,114 @@
+"""
+Caché en disco de respuestas de OpenAI.
+Evita repetir peticiones idénticas (reintentos, reanálisis del mismo documento).
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+import aiofiles
+
+from config.settings import settings
+from loguru import logger
+
+class FileCache:
+    """
+    Caché de respuestas del modelo almacenada en archivos.
+    
+    Cada entrada se guarda como `<sha256[:2]>/<sha256>.json` dentro del
+    directorio de caché y expira cuando su fecha de modificación supera el
+    TTL configurado.
+    """
+    
+    def __init__(self, directorio: Optional[str] = None, ttl_dias: Optional[int] = None):
+        """
+        Inicializa la caché.
+        
+        Args:
+            directorio: Directorio de la caché (por defecto settings.CACHE_DIR)
+            ttl_dias: Días de validez de cada entrada (por defecto settings.LLM_CACHE_TTL_DAYS)
+        """
+        self.directorio = Path(directorio or settings.CACHE_DIR)
+        self.ttl_segundos = (ttl_dias if ttl_dias is not None else settings.LLM_CACHE_TTL_DAYS) * 86400
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        
+        logger.debug(f"🗄️ Caché de respuestas en: {self.directorio}")
+    
+    @staticmethod
+    def generar_clave(*partes: str) -> str:
+        """Genera la clave SHA-256 de las partes que identifican una petición."""
+        return hashlib.sha256("\n".join(partes).encode("utf-8")).hexdigest()
+    
+    def _ruta(self, clave: str) -> Path:
+        """Ruta del archivo de una entrada (repartidas en subdirectorios por prefijo)."""
+        return self.directorio / clave[:2] / f"{clave}.json"
+    
+    async def obtener(self, clave: str) -> Optional[str]:
+        """
+        Obtiene una entrada vigente de la caché.
+        
+        Args:
+            clave: Clave de la entrada
+        
+        Returns:
+            Contenido almacenado o None si no existe o expiró
+        """
+        ruta = self._ruta(clave)
+        
+        try:
+            # stat/unlink son llamadas bloqueantes: fuera del event loop
+            if await asyncio.to_thread(self._descartar_si_expirada, ruta):
+                return None
+            
+            async with aiofiles.open(ruta, 'r', encoding='utf-8') as f:
+                contenido = await f.read()
+            
+            # Una entrada vacía nunca es una respuesta válida: se trata como fallo
+            return contenido or None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Error leyendo caché {clave[:12]}: {str(e)}")
+            return None
+    
+    def _descartar_si_expirada(self, ruta: Path) -> bool:
+        """Borra la entrada si superó el TTL (se ejecuta en un hilo)."""
+        if time.time() - ruta.stat().st_mtime > self.ttl_segundos:
+            ruta.unlink(missing_ok=True)
+            return True
+        return False
+    
+    async def guardar(self, clave: str, contenido: str) -> None:
+        """
+        Guarda una entrada en la caché.
+        
+        Se escribe en un archivo temporal de nombre único que luego se
+        renombra, de modo que ni una lectura ni otra escritura concurrente
+        (del mismo proceso o de otro) encuentran una entrada a medio escribir.
+        
+        Args:
+            clave: Clave de la entrada
+            contenido: Contenido a almacenar
+        """
+        try:
+            await asyncio.to_thread(self._escribir_entrada, self._ruta(clave), contenido)
+        except Exception as e:
+            logger.warning(f"⚠️ Error guardando caché {clave[:12]}: {str(e)}")
+    
+    @staticmethod
+    def _escribir_entrada(ruta: Path, contenido: str) -> None:
+        """Escribe una entrada de forma atómica (se ejecuta en un hilo)."""
+        ruta.parent.mkdir(exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix=".tmp")
+        
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                f.write(contenido)
+            os.replace(temporal, ruta)
+        except BaseException:
+            Path(temporal).unlink(missing_ok=True)
+            raise
@@ -0,0 +1,64 @@
+"""
+Cálculo de ratios financieros.
+Calcula de forma determinística los indicadores a partir de las cifras extraídas.
+"""
+
+from typing import Dict
+import numpy as np
+
+# (ratio, numerador, denominador)
+DEFINICION_RATIOS = (
+    ("ratio_corriente", "activo_corriente", "pasivo_corriente"),
+    ("prueba_acida", "activo_acido", "pasivo_corriente"),
+    ("endeudamiento", "pasivo_total", "activo_total"),
+    ("deuda_patrimonio", "pasivo_total", "patrimonio"),
+    ("cobertura_intereses", "utilidad_operacional", "gastos_financieros"),
+    ("roe", "utilidad_neta", "patrimonio"),
+    ("roa", "utilidad_neta", "activo_total"),
+    ("margen_neto", "utilidad_neta", "ventas"),
+    ("margen_operacional", "utilidad_operacional", "ventas"),
+    ("margen_bruto", "utilidad_bruta", "ventas"),
+    ("rotacion_activos", "ventas", "activo_total"),
+    ("rotacion_inventarios", "costo_ventas", "inventarios"),
+    ("periodo_cobro_dias", "cuentas_por_cobrar_anualizadas", "ventas")
+)
+
+_NUMERADORES = tuple(numerador for _, numerador, _ in DEFINICION_RATIOS)
+_DENOMINADORES = tuple(denominador for _, _, denominador in DEFINICION_RATIOS)
+
+def calcular_ratios(hechos: Dict[str, float]) -> Dict[str, float]:
+    """
+    Calcula los ratios de liquidez, solvencia, rentabilidad y eficiencia.
+    
+    Todas las divisiones se resuelven en una sola operación vectorizada; los
+    ratios cuyas cifras faltan o cuyo denominador es cero se omiten.
+    
+    Args:
+        hechos: Cifras del estado financiero (activo_corriente, ventas, ...)
+    
+    Returns:
+        Dict nombre del ratio -> valor redondeado a 4 decimales
+    """
+    valores = dict(hechos)
+    
+    if "activo_corriente" in hechos:
+        valores["activo_acido"] = hechos["activo_corriente"] - hechos.get("inventarios", 0.0)
+    if "cuentas_por_cobrar" in hechos:
+        valores["cuentas_por_cobrar_anualizadas"] = hechos["cuentas_por_cobrar"] * 365
+    
+    numeradores = np.array([valores.get(nombre, np.nan) for nombre in _NUMERADORES], dtype=float)
+    denominadores = np.array([valores.get(nombre, np.nan) for nombre in _DENOMINADORES], dtype=float)
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        resultados = np.round(numeradores / denominadores, 4)
+    
+    ratios = {
+        nombre: float(valor)
+        for (nombre, _, _), valor in zip(DEFINICION_RATIOS, resultados)
+        if np.isfinite(valor)
+    }
+    
+    if "activo_corriente" in hechos and "pasivo_corriente" in hechos:
+        ratios["capital_trabajo"] = float(hechos["activo_corriente"] - hechos["pasivo_corriente"])
+    
+    return ratios
@@ -0,0 +1,132 @@
+"""
+Serialización JSON del sistema.
+Usa orjson cuando está instalado y recurre a la librería estándar si no.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ORJSON_DISPONIBLE = orjson is not None
+
+# Sufijo de los archivos JSON comprimidos con zstd
+SUFIJO_COMPRIMIDO = ".zst"
+ZSTD_DISPONIBLE = zstandard is not None
+NIVEL_ZSTD = 3
+
+# orjson.JSONDecodeError hereda de json.JSONDecodeError, por lo que basta
+# con capturar esta excepción en ambos casos
+JSONDecodeError = json.JSONDecodeError
+
+def cargar_json(contenido: Union[str, bytes]) -> Any:
+    """
+    Decodifica un documento JSON.
+    
+    Args:
+        contenido: Texto o bytes UTF-8 con el JSON
+    
+    Returns:
+        Objeto Python decodificado
+    """
+    if orjson is not None:
+        return orjson.loads(contenido)
+    
+    return json.loads(contenido)
+
+def volcar_json(obj: Any, indentado: bool = False) -> bytes:
+    """
+    Codifica un objeto como JSON en bytes UTF-8 (sin escapar caracteres no ASCII).
+    
+    Args:
+        obj: Objeto a serializar
+        indentado: Usa indentación de 2 espacios
+    
+    Returns:
+        JSON codificado en UTF-8
+    """
+    if orjson is not None:
+        # OPT_NON_STR_KEYS acepta claves no string (int, float...) igual que json
+        opciones = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indentado:
+            opciones |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=opciones)
+    
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indentado else None).encode("utf-8")
+
+def volcar_json_por_partes(obj: Dict[str, Any], campo: str) -> List[bytes]:
+    """
+    Codifica un diccionario como JSON compacto en partes, dejando el campo
+    indicado (normalmente un texto muy grande) como una parte independiente.
+    
+    Permite escribir el JSON en un archivo sin concatenar el campo grande con
+    el resto del documento.
+    
+    Args:
+        obj: Diccionario a serializar
+        campo: Clave del valor que se codifica por separado (queda al final)
+    
+    Returns:
+        Lista de partes en bytes cuya concatenación es el JSON completo
+    """
+    resto = {clave: valor for clave, valor in obj.items() if clave != campo}
+    cabecera = volcar_json(resto)[:-1]
+    separador = b"," if resto else b""
+    
+    return [
+        cabecera + separador + volcar_json(campo) + b":",
+        volcar_json(obj[campo]),
+        b"}"
+    ]
+
+def volcar_json_comprimido(obj: Any) -> bytes:
+    """
+    Codifica un objeto como JSON compacto comprimido con zstd.
+    
+    Args:
+        obj: Objeto a serializar
+    
+    Returns:
+        JSON comprimido (requiere zstandard)
+    """
+    return zstandard.ZstdCompressor(level=NIVEL_ZSTD).compress(volcar_json(obj))
+
+def contenido_json_archivo(contenido: bytes, ruta: Union[str, Path]) -> bytes:
+    """
+    Devuelve el JSON contenido en un archivo, descomprimiéndolo si su nombre
+    termina en `.zst` (sin decodificarlo).
+    
+    Args:
+        contenido: Bytes leídos del archivo
+        ruta: Ruta del archivo (para detectar la compresión)
+    
+    Returns:
+        JSON en bytes UTF-8
+    """
+    if str(ruta).endswith(SUFIJO_COMPRIMIDO):
+        return zstandard.ZstdDecompressor().decompress(contenido)
+    
+    return contenido
+
+def cargar_json_archivo(contenido: bytes, ruta: Union[str, Path]) -> Any:
+    """
+    Decodifica el contenido de un archivo JSON, descomprimiéndolo si su
+    nombre termina en `.zst`.
+    
+    Args:
+        contenido: Bytes leídos del archivo
+        ruta: Ruta del archivo (para detectar la compresión)
+    
+    Returns:
+        Objeto Python decodificado
+    """
+    return cargar_json(contenido_json_archivo(contenido, ruta))
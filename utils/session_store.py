@@ -0,0 +1,117 @@
+"""
+Almacén de sesiones de la Secretaria Virtual.
+Mantiene en memoria las sesiones más recientes y envía las demás a SQLite.
+"""
+
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from config.settings import settings
+from utils.serializacion import cargar_json, volcar_json
+from loguru import logger
+
+class SessionStore:
+    """
+    Caché LRU de sesiones respaldada por SQLite.
+    
+    Las sesiones usadas recientemente se conservan en memoria (hasta la
+    capacidad configurada); al superarla, la menos usada se guarda en la
+    tabla `sessions` y se libera de memoria. Si se vuelve a pedir, se
+    recupera de la base de datos.
+    """
+    
+    def __init__(self, capacidad: Optional[int] = None, ruta_db: Optional[str] = None):
+        """
+        Inicializa el almacén.
+        
+        Args:
+            capacidad: Sesiones máximas en memoria (por defecto settings.SESSION_CACHE_SIZE)
+            ruta_db: Archivo SQLite (por defecto settings.SESSIONS_DB)
+        """
+        self.capacidad = capacidad or settings.SESSION_CACHE_SIZE
+        self._memoria: "OrderedDict[str, Dict]" = OrderedDict()
+        
+        ruta = Path(ruta_db or settings.SESSIONS_DB)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        
+        self._conexion = sqlite3.connect(str(ruta), check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, blob BLOB, updated REAL)"
+        )
+        self._conexion.commit()
+        
+        logger.debug(f"🗂️ Almacén de sesiones en: {ruta} (capacidad en memoria: {self.capacidad})")
+    
+    def __contains__(self, session_id: str) -> bool:
+        if session_id in self._memoria:
+            return True
+        
+        fila = self._conexion.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return fila is not None
+    
+    def get(self, session_id: str) -> Optional[Dict]:
+        """
+        Obtiene una sesión, recuperándola de SQLite si no está en memoria.
+        
+        Args:
+            session_id: ID de la sesión
+        
+        Returns:
+            Datos de la sesión o None si no existe
+        """
+        if session_id in self._memoria:
+            self._memoria.move_to_end(session_id)
+            return self._memoria[session_id]
+        
+        fila = self._conexion.execute("SELECT blob FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if fila is None:
+            return None
+        
+        sesion = cargar_json(fila[0])
+        self.set(session_id, sesion)
+        return sesion
+    
+    def set(self, session_id: str, sesion: Dict) -> None:
+        """
+        Guarda una sesión en memoria, desalojando las menos usadas a SQLite.
+        
+        Args:
+            session_id: ID de la sesión
+            sesion: Datos de la sesión
+        """
+        self._memoria[session_id] = sesion
+        self._memoria.move_to_end(session_id)
+        
+        while len(self._memoria) > self.capacidad:
+            id_antiguo, sesion_antigua = self._memoria.popitem(last=False)
+            self._persistir(id_antiguo, sesion_antigua)
+    
+    def pop(self, session_id: str) -> Optional[Dict]:
+        """
+        Elimina una sesión de memoria y de SQLite.
+        
+        Args:
+            session_id: ID de la sesión
+        
+        Returns:
+            Datos de la sesión eliminada o None si no existía
+        """
+        sesion = self.get(session_id)
+        self._memoria.pop(session_id, None)
+        
+        self._conexion.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        self._conexion.commit()
+        
+        return sesion
+    
+    def _persistir(self, session_id: str, sesion: Dict) -> None:
+        """Guarda una sesión desalojada en SQLite."""
+        self._conexion.execute(
+            "INSERT OR REPLACE INTO sessions (id, blob, updated) VALUES (?, ?, ?)",
+            (session_id, volcar_json(sesion), time.time())
+        )
+        self._conexion.commit()
@@ -0,0 +1,54 @@
+"""
+Recorte de textos a un presupuesto de tokens.
+Usa tiktoken cuando está instalado y, si no, una aproximación por caracteres.
+"""
+
+from functools import lru_cache
+from typing import Any, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Caracteres por token aproximados cuando tiktoken no está disponible
+CARACTERES_POR_TOKEN = 4
+
+@lru_cache(maxsize=8)
+def _codificador(modelo: str) -> Optional[Any]:
+    """Obtiene (una sola vez por modelo) el codificador de tokens."""
+    if tiktoken is None:
+        return None
+    
+    try:
+        return tiktoken.encoding_for_model(modelo)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def recortar_a_tokens(texto: str, max_tokens: int, modelo: str) -> str:
+    """
+    Recorta un texto para que no supere un número de tokens.
+    
+    Args:
+        texto: Texto a recortar
+        max_tokens: Número máximo de tokens
+        modelo: Modelo de OpenAI cuyo tokenizador se usa
+    
+    Returns:
+        Texto recortado (sin palabras partidas en la aproximación por caracteres)
+    """
+    codificador = _codificador(modelo)
+    
+    if codificador is not None:
+        tokens = codificador.encode(texto)
+        if len(tokens) <= max_tokens:
+            return texto
+        return codificador.decode(tokens[:max_tokens])
+    
+    max_caracteres = max_tokens * CARACTERES_POR_TOKEN
+    if len(texto) <= max_caracteres:
+        return texto
+    
+    recorte = texto[:max_caracteres]
+    corte = recorte.rfind(" ")
+    return recorte[:corte] if corte > 0 else recorte
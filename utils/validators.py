@@ -4,12 +4,85 @@ Contiene funciones para validar datos de entrada.
 """
 
 import re
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
 from config.settings import settings
 from loguru import logger
 
+# Sectores empresariales válidos
+SECTORES_VALIDOS = (
+    "Agricultura", "Ganadería", "Pesca", "Minería", "Petróleo",
+    "Manufacturero", "Textil", "Alimentos", "Bebidas", "Automotriz",
+    "Construcción", "Inmobiliario", "Comercio", "Retail", "Mayorista",
+    "Transporte", "Logística", "Telecomunicaciones", "Servicios",
+    "Financiero", "Bancario", "Seguros", "Tecnología", "Software",
+    "Turismo", "Hotelería", "Restaurantes", "Educación", "Salud",
+    "Farmacéutico", "Energía", "Utilities", "Medios", "Entretenimiento",
+    "Consultoría", "Legal", "Otros"
+)
+
+# Caracteres válidos (letras, números, espacios, algunos símbolos)
+PATRON_NOMBRE_EMPRESA = re.compile(r'^[a-zA-ZáéíóúñÑ0-9\s\.\-_&(),"\']+$')
+PATRON_SECTOR = re.compile(r'^[a-zA-ZáéíóúñÑ\s\-_&]+$')
+
+@lru_cache(maxsize=1024)
+def _motivo_nombre_invalido(nombre: str) -> Optional[str]:
+    """
+    Revisa un nombre de empresa (ya sin espacios en los extremos).
+    
+    Los nombres se repiten entre peticiones, así que el resultado se memoriza.
+    
+    Returns:
+        Motivo del rechazo o None si el nombre es válido
+    """
+    # Longitud mínima y máxima
+    if len(nombre) < 3:
+        return "Nombre de empresa muy corto"
+    
+    if len(nombre) > 200:
+        return "Nombre de empresa muy largo"
+    
+    if not PATRON_NOMBRE_EMPRESA.match(nombre):
+        return f"Nombre de empresa contiene caracteres inválidos: {nombre}"
+    
+    # No puede ser solo números o espacios
+    if nombre.replace(" ", "").isdigit():
+        return "Nombre de empresa no puede ser solo números"
+    
+    return None
+
+@lru_cache(maxsize=1024)
+def _revisar_sector(sector: str) -> Tuple[Optional[str], bool]:
+    """
+    Revisa un sector (ya normalizado con strip().title()).
+    
+    El conjunto de sectores que llega en la práctica es pequeño, así que el
+    resultado se memoriza.
+    
+    Returns:
+        Tupla (motivo del rechazo o None, si coincide con un sector conocido)
+    """
+    # Longitud mínima
+    if len(sector) < 3:
+        return "Sector de empresa muy corto", False
+    
+    if len(sector) > 100:
+        return "Sector de empresa muy largo", False
+    
+    # Verificar si está en la lista de sectores válidos (flexible)
+    sector_min = sector.lower()
+    reconocido = any(
+        sector_min in sector_valido.lower() or sector_valido.lower() in sector_min
+        for sector_valido in SECTORES_VALIDOS
+    )
+    
+    if not PATRON_SECTOR.match(sector):
+        return f"Sector contiene caracteres inválidos: {sector}", reconocido
+    
+    return None, reconocido
+
 class DataValidator:
     """
     Clase para validar datos de entrada en el sistema.
@@ -20,16 +93,7 @@ class DataValidator:
     def __init__(self):
         """Inicializa el validador."""
         # Sectores empresariales válidos
-        self.sectores_validos = [
-            "Agricultura", "Ganadería", "Pesca", "Minería", "Petróleo",
-            "Manufacturero", "Textil", "Alimentos", "Bebidas", "Automotriz",
-            "Construcción", "Inmobiliario", "Comercio", "Retail", "Mayorista",
-            "Transporte", "Logística", "Telecomunicaciones", "Servicios",
-            "Financiero", "Bancario", "Seguros", "Tecnología", "Software",
-            "Turismo", "Hotelería", "Restaurantes", "Educación", "Salud",
-            "Farmacéutico", "Energía", "Utilities", "Medios", "Entretenimiento",
-            "Consultoría", "Legal", "Otros"
-        ]
+        self.sectores_validos = list(SECTORES_VALIDOS)
         
         logger.info("✅ Validador de datos inicializado")
     
@@ -49,24 +113,9 @@ class DataValidator:
         
         nombre = nombre.strip()
         
-        # Longitud mínima y máxima
-        if len(nombre) < 3:
-            logger.warning("❌ Nombre de empresa muy corto")
-            return False
-        
-        if len(nombre) > 200:
-            logger.warning("❌ Nombre de empresa muy largo")
-            return False
-        
-        # Caracteres válidos (letras, números, espacios, algunos símbolos)
-        patron_valido = re.compile(r'^[a-zA-ZáéíóúñÑ0-9\s\.\-_&(),"\']+$')
-        if not patron_valido.match(nombre):
-            logger.warning(f"❌ Nombre de empresa contiene caracteres inválidos: {nombre}")
-            return False
-        
-        # No puede ser solo números o espacios
-        if nombre.replace(" ", "").isdigit():
-            logger.warning("❌ Nombre de empresa no puede ser solo números")
+        motivo = _motivo_nombre_invalido(nombre)
+        if motivo:
+            logger.warning(f"❌ {motivo}")
             return False
         
         logger.debug(f"✅ Nombre de empresa válido: {nombre}")
@@ -88,30 +137,13 @@ class DataValidator:
         
         sector = sector.strip().title()  # Capitalizar primera letra
         
-        # Longitud mínima
-        if len(sector) < 3:
-            logger.warning("❌ Sector de empresa muy corto")
-            return False
-        
-        if len(sector) > 100:
-            logger.warning("❌ Sector de empresa muy largo") 
-            return False
-        
-        # Verificar si está en la lista de sectores válidos (flexible)
-        sector_encontrado = False
-        for sector_valido in self.sectores_validos:
-            if (sector.lower() in sector_valido.lower() or 
-                sector_valido.lower() in sector.lower()):
-                sector_encontrado = True
-                break
+        motivo, reconocido = _revisar_sector(sector)
         
-        if not sector_encontrado:
+        if not reconocido and motivo is None:
             logger.info(f"⚠️ Sector no reconocido, pero se acepta: {sector}")
         
-        # Caracteres válidos
-        patron_valido = re.compile(r'^[a-zA-ZáéíóúñÑ\s\-_&]+$')
-        if not patron_valido.match(sector):
-            logger.warning(f"❌ Sector contiene caracteres inválidos: {sector}")
+        if motivo:
+            logger.warning(f"❌ {motivo}")
             return False
         
         logger.debug(f"✅ Sector de empresa válido: {sector}")